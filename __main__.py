@@ -1,7 +1,147 @@
 """Starting point for the game."""
 
-import controller
+import time
+
+# Taken before anything heavy is imported, for --startup-time
+START = time.perf_counter()
+
+import argparse
+import random
+import sys
+import settings
+import util.cli
+
+# controller, profiling and replay are imported where they are used, so
+# each mode only loads what it needs
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Teleport game prototype.')
+    parser.add_argument('--headless', type=int, metavar='TICKS',
+                        help='simulate TICKS ticks without a display')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the game and headless input RNGs')
+    parser.add_argument('--simulation-rate', type=float,
+                        default=settings.SIMULATION_RATE,
+                        help='fixed simulation ticks per second')
+    parser.add_argument('--render-rate', type=float,
+                        default=settings.RENDER_RATE,
+                        help='maximum frames drawn per second')
+    parser.add_argument('--dirty-rects', action='store_true',
+                        default=settings.DIRTY_RECTS,
+                        help='redraw only the regions that changed')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='record per-phase timings, show them on '
+                             'screen and export them to PATH (.csv or '
+                             '.json) on exit')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record every tick of input to PATH')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='replay a recording headless at full speed and '
+                             'check its final state hash')
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help='save a snapshot of the headless game to PATH '
+                             'when it ends')
+    parser.add_argument('--resume', metavar='PATH',
+                        help='start the headless game from the snapshot at '
+                             'PATH')
+    parser.add_argument('--world-size', type=util.cli.world_size,
+                        default=settings.WORLD_SIZE, metavar='WxH',
+                        help='arena size, the camera follows the player '
+                             'when it is bigger than the screen')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='print the time to the first frame and exit')
+    args = parser.parse_args()
+    if (args.snapshot or args.resume) and not args.headless:
+        parser.error('--snapshot and --resume need --headless')
+    if args.resume and args.record:
+        # A recording replays from a new game, not from the snapshot
+        parser.error('--record cannot be used with --resume')
+    return args
+
+
+def run_headless(ticks, seed=None, simulation_rate=settings.SIMULATION_RATE,
+                 profile_path=None, record_path=None,
+                 size=settings.WORLD_SIZE, snapshot_path=None,
+                 resume_path=None):
+    """Simulate [ticks] ticks with random input and report throughput."""
+    import controller
+    import profiling
+    dt = 1000.0 / simulation_rate
+    seed = seed if seed is not None else random.randrange(2**31)
+    profiler = profiling.Profiler() if profile_path else None
+    input_source = controller.RandomInputController(seed)
+    recorder = None
+    if record_path:
+        import replay
+        recorder = replay.InputRecorder(record_path, seed, dt, size)
+        input_source = replay.RecordingInputController(input_source,
+                                                       recorder)
+    if resume_path:
+        import snapshot
+        start = time.perf_counter()
+        simulation = snapshot.load(resume_path)
+        print('resumed {} at tick {} in {:.1f} ms'.format(
+            resume_path, simulation.tick,
+            (time.perf_counter() - start) * 1000.0))
+        simulation.input_source = input_source
+        if profiler:
+            simulation.profiler = profiler
+    else:
+        simulation = controller.SimulationController(size, input_source, dt,
+                                                     profiler, seed)
+    start = time.perf_counter()
+    simulation.run(ticks)
+    elapsed = time.perf_counter() - start
+    print('{} ticks in {:.3f}s ({:.0f} ticks/s)'.format(
+        ticks, elapsed, ticks / elapsed))
+    if profiler:
+        profiler.export(profile_path)
+    if recorder:
+        recorder.close(simulation)
+    if snapshot_path:
+        import snapshot
+        start = time.perf_counter()
+        snapshot.save(simulation, snapshot_path)
+        print('saved {} at tick {} in {:.1f} ms'.format(
+            snapshot_path, simulation.tick,
+            (time.perf_counter() - start) * 1000.0))
+
+
+def run_replay(path):
+    """Replay the recording at [path] and report whether it matched."""
+    import replay
+    matches, ticks, elapsed = replay.replay(path)
+    print('{} ticks in {:.3f}s ({:.0f} ticks/s)'.format(
+        ticks, elapsed, ticks / max(elapsed, 1e-9)))
+    if matches is None:
+        print('no final state hash recorded')
+    else:
+        print('state hash ' + ('matches' if matches else 'DIFFERS'))
+    return matches is not False
+
+
+def report_startup():
+    """Print the time since START and exit, called on the first frame."""
+    print('first frame after {:.1f} ms'.format(
+        (time.perf_counter() - START) * 1000.0))
+    sys.exit()
+
 
 if __name__ == '__main__':
-    game_controller = controller.GameController()
-    game_controller.start()
+    args = parse_args()
+    if args.replay:
+        sys.exit(0 if run_replay(args.replay) else 1)
+    elif args.headless:
+        run_headless(args.headless, args.seed, args.simulation_rate,
+                     args.profile, args.record, args.world_size,
+                     args.snapshot, args.resume)
+    else:
+        import controller
+        game_controller = controller.GameController(
+            args.simulation_rate, args.render_rate, args.dirty_rects,
+            args.profile, args.record, args.seed,
+            report_startup if args.startup_time else None,
+            args.world_size)
+        game_controller.start()
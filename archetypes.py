@@ -0,0 +1,250 @@
+"""
+Enemy archetypes: how each kind of enemy looks, moves and fires.
+
+Archetypes are read from archetypes.json, a dict of name -> spec:
+
+    "ring": {
+        "weight": 1, "after": 60000, "size": [30, 30], "health": 250,
+        "cooldown": 4000, "color": [255, 127, 0],
+        "fire": {"pattern": "ring", "count": 32, "speed": 0.1},
+        "move": {"behavior": "orbit", "radius": 40, "period": 5000}
+    }
+
+Every key is optional. [size], [cooldown] and the fire [speed] default
+to the EnemyController's enemy_size, enemy_cooldown and
+projectile_speed, so tuning those still tunes the archetypes that leave
+them out. [health] is how many ms an enemy survives inside the
+teleporter, 0 for destroyed on contact. [after] is the game time in ms
+before the archetype starts spawning and [weight] its share of spawns.
+
+Fire patterns set the defaults of one volley: [count] shots spread
+evenly over [angle] degrees around the aim at the target (360 for a
+ring), fired [bursts] times [interval] ms apart every [cooldown] ms.
+
+    aimed  1 shot
+    spread 5 shots over 45 degrees
+    burst  3 volleys of 1 shot, 120 ms apart
+    ring   16 shots all around
+
+Movement behaviors, in px per ms:
+
+    still  stays where it spawned
+    chase  moves at [speed] toward the nearest player, stopping
+           [distance] px from it
+    drift  moves at [speed] in a random direction, bouncing off the
+           arena's walls
+    orbit  circles [radius] px around its spawn point every [period] ms
+
+An Archetype works on arrays of all its enemies at once, so an update
+costs a few NumPy operations per archetype rather than a method call
+per enemy or per shot.
+
+"""
+
+import json
+import math
+import os
+import numpy
+import util.vector
+
+ARCHETYPES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'archetypes.json')
+
+# Fire pattern -> defaults of (count, angle in degrees, bursts, interval)
+PATTERNS = {
+    'aimed': (1, 0, 1, 0),
+    'spread': (5, 45, 1, 0),
+    'burst': (1, 0, 3, 120),
+    'ring': (16, 360, 1, 0),
+}
+BEHAVIORS = ('still', 'chase', 'drift', 'orbit')
+
+
+class Archetype:
+    """
+    One kind of enemy, see the module docstring for the spec.
+
+        Attributes:
+            [name]      name in the config
+            [weight]    relative chance of being spawned
+            [after]     game time in ms before it spawns
+            [size]      tuple (width, height), or None for the default
+            [health]    ms it survives inside the teleporter
+            [cooldown]  ms between volleys, or None for the default
+            [color]     tuple (r, g, b) it is drawn in
+            [pattern]   name of the fire pattern
+            [speed]     projectile speed, or None for the default
+            [bursts]    volleys fired per cooldown
+            [interval]  ms between the volleys of a burst
+            [turns]     float array (count, 2) of the (cos, sin) each
+                        shot is turned by from the aim
+            [behavior]  name of the movement behavior
+            [moves]     False if it never moves
+
+    """
+
+    def __init__(self, name, weight=1, after=0, size=None, health=0,
+                 cooldown=None, color=(255, 0, 0), fire=None, move=None):
+        """
+        Create new Archetype.
+
+            Parameters:
+                [name] name of the archetype
+                [fire] (optional) dict of pattern, count, angle, speed,
+                       bursts and interval, one aimed shot by default
+                [move] (optional) dict of behavior and its speed,
+                       distance, radius and period, still by default
+
+        The other parameters are the attributes of the same name.
+
+        """
+        fire = dict(fire or {})
+        move = dict(move or {})
+        self.name = name
+        self.weight = weight
+        self.after = after
+        self.size = tuple(size) if size else None
+        self.health = health
+        self.cooldown = cooldown
+        self.color = tuple(color)
+        self.pattern = fire.pop('pattern', 'aimed')
+        if self.pattern not in PATTERNS:
+            raise ValueError('archetype {!r}: unknown fire pattern {!r}'
+                             .format(name, self.pattern))
+        count, angle, bursts, interval = PATTERNS[self.pattern]
+        count = fire.pop('count', count)
+        angle = fire.pop('angle', angle)
+        self.speed = fire.pop('speed', None)
+        self.bursts = fire.pop('bursts', bursts)
+        self.interval = fire.pop('interval', interval)
+        self.behavior = move.pop('behavior', 'still')
+        if self.behavior not in BEHAVIORS:
+            raise ValueError('archetype {!r}: unknown behavior {!r}'.format(
+                name, self.behavior))
+        self.move_speed = move.pop('speed', 0.0)
+        self.distance = move.pop('distance', 0.0)
+        self.radius = move.pop('radius', 0.0)
+        self.period = move.pop('period', 1000.0)
+        if fire or move:
+            raise ValueError('archetype {!r}: unknown keys {}'.format(
+                name, sorted(fire) + sorted(move)))
+        if count < 1 or self.bursts < 1:
+            raise ValueError('archetype {!r}: needs at least one shot'
+                             .format(name))
+        if cooldown is not None \
+                and (self.bursts - 1) * self.interval >= cooldown:
+            raise ValueError('archetype {!r}: burst outlasts its cooldown'
+                             .format(name))
+        # A full circle doesn't repeat its first shot at the end
+        if angle >= 360:
+            angles = numpy.arange(count) * (2.0 * math.pi / count)
+        else:
+            angles = numpy.radians(numpy.linspace(-angle / 2.0, angle / 2.0,
+                                                  count))
+        self.turns = numpy.column_stack((numpy.cos(angles),
+                                         numpy.sin(angles)))
+        self.turns[angles == 0] = (1.0, 0.0)  # Aim exactly
+        self.moves = self.behavior != 'still'
+
+    def __repr__(self):
+        """Return a debugging representation."""
+        return '<Archetype {!r}>'.format(self.name)
+
+    @property
+    def count(self):
+        """Number of shots in one volley."""
+        return len(self.turns)
+
+    def start(self, center, random):
+        """
+        Return the (anchor, heading) an enemy spawned at [center] moves by.
+
+        The anchor is the center of an orbit, otherwise the spawn point;
+        the heading is the velocity of a drift and the (cos, sin) of the
+        angle an orbit starts at.
+
+            Parameters:
+                [center] tuple (x, y) of the spawn point
+                [random] random.Random to pick directions with
+
+        """
+        if self.behavior not in ('drift', 'orbit'):
+            return center, (0.0, 0.0)
+        angle = random.uniform(0.0, 2.0 * math.pi)
+        x, y = math.cos(angle), math.sin(angle)
+        if self.behavior == 'drift':
+            return center, (x * self.move_speed, y * self.move_speed)
+        return ((center[0] - x * self.radius, center[1] - y * self.radius),
+                (x, y))
+
+    def move(self, centers, anchors, headings, ages, dt, targets, low,
+             high):
+        """
+        Return the new centers of all enemies of this archetype.
+
+            Parameters:
+                [centers]  float array (n, 2) of their centers
+                [anchors]  float array (n, 2), see start()
+                [headings] float array (n, 2), see start()
+                [ages]     float array (n,) of ms since each spawned
+                [dt]       ms since the last move, or float array (n,)
+                           of them
+                [targets]  float array (n, 2) of the nearest players
+                [low]      float array (n, 2) of the smallest centers
+                           that keep them in the arena
+                [high]     float array (n, 2) of the largest ones
+
+        """
+        if self.behavior == 'chase':
+            offsets = util.vector.subtract_many(targets, centers)
+            lengths = util.vector.magnitude_many(offsets)
+            steps = numpy.clip(lengths - self.distance, 0.0,
+                               self.move_speed * dt)
+            lengths[lengths == 0] = 1.0
+            centers = centers + offsets * (steps / lengths)[:, None]
+        elif self.behavior == 'drift':
+            # Unfold the walls: bouncing between them is a triangle wave
+            span = numpy.maximum(high - low, 1e-9)
+            travel = anchors - low + headings * ages[:, None]
+            travel %= 2.0 * span
+            centers = low + span - numpy.abs(travel - span)
+        elif self.behavior == 'orbit':
+            angles = ages * (2.0 * math.pi / self.period)
+            cos, sin = numpy.cos(angles), numpy.sin(angles)
+            x, y = headings[:, 0], headings[:, 1]
+            turned = numpy.column_stack((x * cos - y * sin,
+                                         x * sin + y * cos))
+            centers = anchors + turned * self.radius
+        return numpy.clip(centers, low, high)
+
+    def volley(self, origins, targets, speed):
+        """
+        Return velocities (n * count, 2) of one volley from every origin.
+
+        Each origin's shots are consecutive rows, aimed at its target and
+        turned by [turns].
+
+            Parameters:
+                [origins] float array (n, 2) of the enemies' centers
+                [targets] float array (n, 2) of what they aim at
+                [speed]   projectile speed in px per ms
+
+        """
+        aims = util.vector.aim_many(origins, targets, speed)
+        x, y = aims[:, 0, None], aims[:, 1, None]
+        cos, sin = self.turns[:, 0], self.turns[:, 1]
+        velocities = numpy.empty((len(aims), self.count, 2))
+        velocities[:, :, 0] = x * cos - y * sin
+        velocities[:, :, 1] = x * sin + y * cos
+        return velocities.reshape(-1, 2)
+
+
+# Plain enemy for code that doesn't pick an archetype
+DEFAULT = Archetype('basic')
+
+
+def load(path=ARCHETYPES):
+    """Return dict of name -> Archetype from the config at [path]."""
+    with open(path) as f:
+        specs = json.load(f)
+    return {name: Archetype(name, **spec) for name, spec in specs.items()}
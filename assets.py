@@ -0,0 +1,151 @@
+"""Background loading of the game's sounds, music and images."""
+
+import json
+import os
+import queue
+import threading
+import pygame
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'assets')
+MANIFEST = os.path.join(ASSET_DIR, 'manifest.json')
+
+
+def read_manifest(path=MANIFEST):
+    """
+    Return the [(kind, name, path)] entries of the manifest at [path].
+
+    The manifest maps each kind ('sounds', 'music' or 'images') to a dict
+    of asset name -> file path relative to the manifest.
+
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(path)
+    return [(kind, name, os.path.join(base, filename))
+            for kind in ('music', 'sounds', 'images')
+            for name, filename in sorted(manifest.get(kind, {}).items())]
+
+
+class AssetLoader:
+    """
+    Loads and decodes assets on a background thread.
+
+    Nothing here blocks on disk: get() returns whatever has finished
+    loading, and play_music() hands the request to the loader thread, so
+    it starts once the manifest is loaded. Music is streamed from disk by
+    pygame.mixer.music rather than decoded into memory. Assets that fail
+    to load (a missing file, no audio device) are recorded in [errors]
+    and the game runs without them.
+
+        Attributes:
+            [cache]    dict of asset name -> Sound, Surface or music path
+            [errors]   dict of asset name -> reason it failed to load
+            [loaded]   number of entries processed so far
+            [total]    number of entries in the manifest, once read
+            [progress] function (loaded, total, name) called from the
+                       loader thread after each entry, or None
+
+    """
+
+    def __init__(self, manifest=MANIFEST, progress=None):
+        """
+        Create asset loader.
+
+            Parameters:
+                [manifest] (optional) path of the manifest to load
+                [progress] (optional) loading-progress hook
+
+        """
+        self.manifest = manifest
+        self.progress = progress
+        self.cache = {}
+        self.errors = {}
+        self.loaded = 0
+        self.total = 0
+        self.done = threading.Event()
+        self.requests = queue.Queue()  # (music name, loops) to play
+        self.thread = threading.Thread(target=self.run, name='assets',
+                                       daemon=True)
+
+    def start(self):
+        """Start loading in the background and return immediately."""
+        self.thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until every entry is processed, return whether it was."""
+        return self.done.wait(timeout)
+
+    def get(self, name, default=None):
+        """Return the loaded asset [name], or [default] if it isn't yet."""
+        return self.cache.get(name, default)
+
+    def stop(self):
+        """Ask the loader thread to exit once its pending work is done."""
+        self.requests.put((None, 0))
+
+    def run(self):
+        """Load every entry in manifest order, then serve music requests."""
+        try:
+            entries = read_manifest(self.manifest)
+        except (OSError, ValueError) as error:
+            self.errors[self.manifest] = str(error)
+            entries = []
+        self.total = len(entries)
+        for kind, name, path in entries:
+            try:
+                self.cache[name] = getattr(self, 'load_' + kind)(path)
+            except (pygame.error, OSError) as error:
+                self.errors[name] = str(error)
+            self.loaded += 1
+            if self.progress:
+                self.progress(self.loaded, self.total, name)
+        self.done.set()
+        while True:
+            name, loops = self.requests.get()
+            if name is None:
+                return
+            self.stream(name, loops)
+
+    def init_mixer(self):
+        """Start the audio subsystem, here rather than on the main thread."""
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+
+    def load_sounds(self, path):
+        """Decode the sound at [path] into memory."""
+        self.init_mixer()
+        return pygame.mixer.Sound(path)
+
+    def load_music(self, path):
+        """Check that the music at [path] can be opened for streaming."""
+        self.init_mixer()
+        with open(path, 'rb'):
+            pass
+        return path
+
+    def load_images(self, path):
+        """Decode the image at [path], convert() it once displayed."""
+        return pygame.image.load(path)
+
+    def play_music(self, name, loops=-1):
+        """
+        Stream the music [name] once it is loaded, without blocking.
+
+            Parameters:
+                [name]  music name in the manifest
+                [loops] (optional) repeats, -1 to loop forever
+
+        """
+        self.requests.put((name, loops))
+
+    def stream(self, name, loops):
+        """Open the music [name] for streaming and play it."""
+        if name not in self.cache:
+            return  # Failed to load, see [errors]
+        try:
+            pygame.mixer.music.load(self.cache[name])
+            pygame.mixer.music.play(loops)
+        except pygame.error as error:
+            self.errors[name] = str(error)
@@ -0,0 +1,145 @@
+"""Parallel batch runner for headless, bot-driven balance sessions."""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+import controller
+import settings
+
+SIZE = (800, 450)
+
+# Tunable parameters and where they live
+PARAMETERS = {
+    'spawn_cooldown_step': 'enemy_controller',
+    'min_spawn_cooldown': 'enemy_controller',
+    'max_spawn_cooldown': 'enemy_controller',
+    'enemy_cooldown': 'enemy_controller',
+    'projectile_speed': 'enemy_controller',
+}
+# Parameters that also scale what the archetypes set for themselves:
+# name -> archetype attributes scaled with it
+ARCHETYPE_SCALES = {
+    'enemy_cooldown': ('cooldown', 'interval'),
+    'projectile_speed': ('speed',),
+}
+
+
+def set_parameter(simulation, name, value):
+    """
+    Set the PARAMETERS [name] of the [simulation] to [value].
+
+    The enemy_cooldown and projectile_speed defaults only reach the
+    archetypes that leave them out, so every archetype's own cooldown
+    and burst interval, or shot speed, is scaled by the same factor.
+
+    """
+    owner = getattr(simulation, PARAMETERS[name])
+    scale = float(value) / getattr(owner, name)
+    setattr(owner, name, value)
+    for archetype in simulation.enemy_controller.archetypes.values():
+        for attribute in ARCHETYPE_SCALES.get(name, ()):
+            if getattr(archetype, attribute) is not None:
+                setattr(archetype, attribute,
+                        getattr(archetype, attribute) * scale)
+
+
+def run_session(task):
+    """
+    Play one bot session until game over or [max_ticks] and summarize it.
+
+        Parameters:
+            [task] tuple (params, seed, max_ticks) where params is a dict
+                   of PARAMETERS to override
+
+    """
+    params, seed, max_ticks = task
+    bot = controller.BotInputController(seed=seed)
+    simulation = controller.SimulationController(
+        SIZE, bot, 1000.0 / settings.SIMULATION_RATE, seed=seed
+    )
+    bot.simulation = simulation
+    for name, value in params.items():
+        set_parameter(simulation, name, value)
+    simulation.reset()
+    start = time.perf_counter()
+    while not simulation.game_over and simulation.tick < max_ticks:
+        simulation.step()
+    elapsed = time.perf_counter() - start
+    return {
+        'params': params,
+        'seed': seed,
+        'survival_ms': simulation.time,
+        'survived': not simulation.game_over,
+        'kills': simulation.kills,
+        'ticks': simulation.tick,
+        'tick_us': elapsed / max(simulation.tick, 1) * 1e6,
+    }
+
+
+def sweep(grid, seeds):
+    """Return the (params, seed) pairs of every [grid] combination."""
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        for seed in seeds:
+            yield dict(zip(names, values)), seed
+
+
+def run_batch(grid, seeds, max_ticks, processes=None):
+    """
+    Run every session of the sweep across a process pool.
+
+    Results are yielded as soon as each session finishes, in completion
+    order.
+
+        Parameters:
+            [grid]      dict of parameter name -> list of values
+            [seeds]     seeds to run every combination with
+            [max_ticks] tick limit per session
+            [processes] (optional) pool size, one per core by default
+
+    """
+    tasks = [(params, seed, max_ticks) for params, seed in sweep(grid, seeds)]
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(run_session, tasks):
+            yield result
+
+
+def parse_param(text):
+    """Parse 'name=v1,v2,...' into (name, [values])."""
+    name, _, values = text.partition('=')
+    if name not in PARAMETERS or not values:
+        raise argparse.ArgumentTypeError(
+            'expected NAME=V1,V2,... with NAME one of '
+            + ', '.join(sorted(PARAMETERS)))
+    return name, [float(value) for value in values.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--param', type=parse_param, action='append',
+                        default=[], metavar='NAME=V1,V2',
+                        help='parameter values to sweep, repeatable')
+    parser.add_argument('--seeds', type=int, default=8,
+                        help='sessions per parameter combination')
+    parser.add_argument('--max-ticks', type=int, default=36000,
+                        help='tick limit per session')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, one per core by default')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write JSON lines to PATH instead of stdout')
+    args = parser.parse_args()
+
+    grid = dict(args.param)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    for result in run_batch(grid, range(args.seeds), args.max_ticks,
+                            args.processes):
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        count += 1
+    elapsed = time.perf_counter() - start
+    sys.stderr.write('{} sessions in {:.1f}s\n'.format(count, elapsed))
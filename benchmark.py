@@ -0,0 +1,560 @@
+"""Benchmarks for the game's hot paths."""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import numpy
+import pygame
+import archetypes
+import controller
+import env
+import model
+import scheduler
+import util.rect
+import util.vector
+import view
+
+# Rendering benchmarks draw to SDL's dummy video driver
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+SIZE = (800, 450)
+
+
+def measure_ticks(tick, ticks=200, warmup=10):
+    """
+    Time [ticks] calls of [tick] and return their latency statistics.
+
+        Parameters:
+            [tick]   function advancing the benchmark by one tick
+            [ticks]  (optional) number of timed calls
+            [warmup] (optional) untimed calls made first
+
+    """
+    for _ in range(warmup):
+        tick()
+    samples = numpy.empty(ticks)
+    clock = time.perf_counter
+    for i in range(ticks):
+        start = clock()
+        tick()
+        samples[i] = clock() - start
+    p50, p99 = numpy.percentile(samples, (50, 99)) * 1e6
+    return {
+        'ticks': ticks,
+        'throughput': ticks / samples.sum(),
+        'mean_us': samples.mean() * 1e6,
+        'p50_us': p50,
+        'p99_us': p99,
+    }
+
+
+def create_scene(enemy_count, projectile_count, size=SIZE, seed=0,
+                 speed=0.0, clock=None):
+    """Return (player, enemies, projectiles) scattered over an arena."""
+    rng = random.Random(seed)
+    clock = clock or scheduler.TimerQueue()
+    width, height = size
+    player = model.Player((width/2.0, height/2.0), (20, 20))
+    player.teleporter.grow(1000)
+    projectiles = model.ProjectileStore()
+    enemies = []
+    for _ in range(enemy_count):
+        center = (rng.uniform(0, width), rng.uniform(0, height))
+        enemy = model.Enemy(center, (20, 20), projectiles, clock)
+        enemy.timer = rng.uniform(0, enemy.cooldown)
+        enemies.append(enemy)
+    for i in range(projectile_count):
+        center = (rng.uniform(0, width), rng.uniform(0, height))
+        velocity = (rng.uniform(-speed, speed), rng.uniform(-speed, speed))
+        owner = enemies[i % enemy_count].id if enemies else -1
+        projectiles.spawn(center, (10, 10), velocity, owner)
+    return player, enemies, projectiles
+
+
+def bench_enemy_update(count):
+    """EnemyController.update with [count] enemies and projectiles."""
+    enemy_controller = controller.EnemyController(SIZE, seed=0)
+    enemy_controller.reset()
+    player, enemies, projectiles = create_scene(
+        count, count, speed=0.01, clock=enemy_controller.timers)
+    enemy_controller.projectiles = projectiles
+    for enemy in enemies:
+        enemy_controller.add_enemy(enemy)
+
+    def tick():
+        enemy_controller.update(1000.0 / 60.0, player)
+    return {'default': tick}
+
+
+def bench_archetypes(count):
+    """EnemyController.update with [count] enemies of each archetype."""
+    kinds = dict(controller.EnemyController(SIZE).archetypes)
+    # Ring bursts of hundreds of shots per volley
+    kinds['ring256'] = archetypes.Archetype(
+        'ring256', cooldown=4000, fire={'pattern': 'ring', 'count': 256,
+                                        'speed': 0.1})
+    variants = {}
+    for name, archetype in kinds.items():
+        enemy_controller = controller.EnemyController(SIZE, seed=0)
+        enemy_controller.reset()
+        player, enemies, _ = create_scene(count, 0,
+                                          clock=enemy_controller.timers)
+        rng = random.Random(count)
+        for enemy in enemies:
+            enemy.archetype = archetype
+            enemy.health = archetype.health
+            if archetype.cooldown is not None:
+                enemy.cooldown = archetype.cooldown
+            enemy.timer = rng.uniform(0, enemy.cooldown)
+            enemy.anchor, enemy.heading = archetype.start(enemy.rect.center,
+                                                          rng)
+            enemy_controller.add_enemy(enemy)
+        variants[name] = (lambda c: lambda: c.update(
+            1000.0 / 60.0, player))(enemy_controller)
+    return variants
+
+
+def bench_projectiles(count):
+    """
+    One tick of ProjectileStore with [count] projectiles alive.
+
+    Moves, culls and collides them with the player, as the headless game
+    does every tick; a single-player game keeps about a dozen alive, so
+    run it with `--counts 1 5 10 20` too. 'numpy' never takes the Python
+    path below ProjectileStore.small.
+
+    """
+    variants = {}
+    for name, small in (('default', model.ProjectileStore.small),
+                        ('numpy', 0)):
+        player, _, projectiles = create_scene(0, count)
+        projectiles.small = small
+        bounds = util.rect.FloatRect((SIZE[0] / 2.0, SIZE[1] / 2.0), SIZE)
+
+        def tick(player=player, projectiles=projectiles, bounds=bounds):
+            projectiles.update(0.0)
+            projectiles.cull(bounds)
+            projectiles.collide_rect(player.rect)
+        variants[name] = tick
+    return variants
+
+
+def bench_collision_player(count):
+    """CollisionController.update_player against [count] projectiles."""
+    player, _, projectiles = create_scene(0, count)
+    collision_controller = controller.CollisionController(SIZE)
+
+    def tick():
+        collision_controller.update_player(player, projectiles)
+    return {'linear': tick}
+
+
+def bench_collision_enemy(count):
+    """CollisionController.update_enemy against [count] enemies."""
+    player, enemies, _ = create_scene(count, 0)
+    # EnemyController caches this between spawns and kills
+    geometry = controller.enemy_geometry(enemies)
+    collision_controller = controller.CollisionController(SIZE)
+
+    def tick():
+        collision_controller.update_enemy(player, enemies, geometry)
+    return {'linear': tick}
+
+
+def bench_broad_phase(count):
+    """
+    CollisionController.update_players over [count] projectiles.
+
+    1, 8, 16 and 200 players scattered over a server-sized arena, each
+    tested in turn (linear) or looked up together in one grid (hash),
+    which is forced on below BROAD_PHASE_MIN_QUERIES to show where it
+    starts to pay.
+
+    """
+    size = (4000, 3000)
+    _, _, projectiles = create_scene(0, count, size=size)
+    variants = {}
+    for player_count in (1, 8, 16, 200):
+        rng = random.Random(player_count)
+        players = [model.Player((rng.uniform(0, size[0]),
+                                 rng.uniform(0, size[1])), (20, 20))
+                   for _ in range(player_count)]
+        for name, spatial_hash in (('linear', False), ('hash', True)):
+            collision_controller = controller.CollisionController(
+                size, spatial_hash=spatial_hash, min_queries=1)
+            variants['{}_q{}'.format(name, player_count)] = (
+                lambda c, p: lambda: c.update_players(p, projectiles))(
+                    collision_controller, players)
+    return variants
+
+
+def bench_player_update(count):
+    """PlayerController.update with [count] trail entries alive."""
+    player_controller = controller.PlayerController(SIZE)
+    player_controller.reset_player()
+    # Keep them alive for the whole benchmark
+    player_controller.trail = model.TrailBuffer(
+        player_controller.timers, count, decay_time=float('inf'))
+    for _ in range(count):
+        player_controller.trail.add(player_controller.player.teleporter.rect)
+
+    def tick():
+        player_controller.update(1000.0 / 60.0, [0, 0], False)
+    return {'default': tick}
+
+
+def bench_view_draw(count):
+    """
+    GameView.draw with [count] enemies and projectiles.
+
+    Enemies cycle through every archetype's color, with their cooldown
+    rings at random sizes, and the trail is full, its circles as big and
+    as faded as a growing teleporter leaves them. Each variant reports
+    the SurfaceCache hit rate of its timed frames.
+
+    """
+    pygame.display.init()
+    clock = scheduler.TimerQueue()
+    player, enemies, projectiles = create_scene(count, count, clock=clock)
+    kinds = sorted(archetypes.load().values(), key=lambda a: a.name)
+    for i, enemy in enumerate(enemies):
+        enemy.archetype = kinds[i % len(kinds)]
+    trail = model.TrailBuffer(clock)
+    teleporter = model.Teleporter(player.rect.center, player.rect.size)
+    for _ in range(len(trail.created_at)):
+        if teleporter.rect.width >= teleporter.max:
+            teleporter.reset()
+        teleporter.grow(1000.0 / 60.0)
+        teleporter.rect.center = player.rect.center
+        trail.add(teleporter.rect)
+        clock.advance(trail.decay_time / len(trail.created_at))
+    cache = view.surface_cache
+    variants = {}
+    for name, dirty_rects in (('full', False), ('dirty_rects', True)):
+        variants[name] = draw_tick(view.GameView(dirty_rects), cache,
+                                   player, enemies, projectiles, trail)
+    return variants
+
+
+def draw_tick(game_view, cache, *scene):
+    """Return a tick drawing the [scene], counting [cache] hits as extra."""
+    counts = [0, 0]
+
+    def tick():
+        hits, misses = cache.hits, cache.misses
+        game_view.draw(*scene)
+        counts[0] += cache.hits - hits
+        counts[1] += cache.misses - misses
+    tick.extra = {'hit_rate': lambda: counts[0] / float(sum(counts) or 1)}
+    return tick
+
+
+class DictTeleporter:
+    """Teleporter as it was before __slots__ and FloatRect, for `entities`."""
+
+    def __init__(self, center, size):
+        """Create new DictTeleporter."""
+        self.span = self.min, self.max = 20, 200
+        self.rect = pygame.Rect((0, 0), size)
+        self.rect.center = center
+        self.period = 1600
+        self.velocity = 0.33
+
+    def reset(self):
+        """Reset to [min] length, keeping the center."""
+        center = self.rect.center
+        self.rect.width = self.rect.height = self.min
+        self.rect.center = center
+
+    def grow(self, dt):
+        """Expand, keeping the center."""
+        center = self.rect.center
+        self.rect.width += dt*self.velocity
+        self.rect.height += dt*self.velocity
+        if self.rect.width > self.max or self.rect.height > self.max:
+            self.rect.width = self.rect.height = self.max
+        self.rect.center = center
+
+
+class DictPlayer:
+    """Player as it was before __slots__ and FloatRect, for `entities`."""
+
+    def __init__(self, center, size):
+        """Create new DictPlayer."""
+        self.rect = pygame.Rect((0, 0), size)
+        self.rect.center = center
+        self.teleporter = DictTeleporter(center, size)
+
+    def move(self, vec):
+        """Move by half the teleporter in direction [vec]."""
+        x, y = vec
+        self.rect.move_ip(x*self.teleporter.rect.width/2.0,
+                          y*self.teleporter.rect.height/2.0)
+        if x != 0 or y != 0:
+            self.teleporter.reset()
+        self.teleporter.rect.center = self.rect.center
+
+
+class DictEnemy:
+    """Enemy as it was before __slots__ and FloatRect, for `entities`."""
+
+    def __init__(self, center, size, projectiles, cooldown=1600):
+        """Create new DictEnemy."""
+        self.id = 0
+        self.rect = pygame.Rect((0, 0), size)
+        self.rect.center = center
+        self.cooldown = cooldown
+        self.timer = 0
+        self.projectiles = projectiles
+
+
+class DictTrailEntry:
+    """Trail entry as it was before TrailBuffer, for `entities`."""
+
+    def __init__(self, teleporter):
+        """Create new DictTrailEntry left by the [teleporter]."""
+        self.rect = pygame.Rect(teleporter.rect.topleft,
+                                teleporter.rect.size)
+        self.decay_time = 100
+        self.timer = 0
+
+
+def bench_entities(count):
+    """
+    Grow, move and bound [count] players; report bytes per entity.
+
+    The `dict_rect` variant is the layout before entities had __slots__,
+    FloatRect geometry and the TrailBuffer, to compare against.
+
+    """
+    def current():
+        clock = scheduler.TimerQueue()
+        projectiles = model.ProjectileStore(1)
+        players = [model.Player((400.0, 225.0), (20, 20))
+                   for _ in range(count)]
+        trail = model.TrailBuffer(clock, count)
+        for player in players:
+            trail.add(player.teleporter.rect)
+        enemies = [model.Enemy((100.0, 100.0), (20, 20), projectiles, clock)
+                   for _ in range(count)]
+        return players, (enemies, trail)
+
+    def dict_rect():
+        players = [DictPlayer((400.0, 225.0), (20, 20))
+                   for _ in range(count)]
+        trail = [DictTrailEntry(player.teleporter) for player in players]
+        enemies = [DictEnemy((100.0, 100.0), (20, 20), None)
+                   for _ in range(count)]
+        return players, (enemies, trail)
+
+    variants = {}
+    for name, create in (('default', current), ('dict_rect', dict_rect)):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        players, others = create()
+        used = tracemalloc.get_traced_memory()[0] - before
+        del others
+        tracemalloc.stop()
+        variants[name] = entities_tick(players)
+        # Player (with its Teleporter), Enemy and trail entry
+        variants[name].extra = {'bytes_per_entity': used / (3.0 * count)}
+    return variants
+
+
+def entities_tick(players):
+    """Return the `entities` tick over [players]."""
+    bounds = pygame.Rect((0, 0), SIZE)
+
+    def tick():
+        for player in players:
+            player.teleporter.grow(1000.0 / 60.0)
+            player.move((1, 0))
+            player.move((-1, 0))
+            if player.rect.right > bounds.width:
+                player.rect.move_ip(bounds.width - player.rect.right, 0)
+    return tick
+
+
+def legacy_subtract(a, b):
+    """util.vector.subtract as it was before it went allocation-free."""
+    def subtract(a, b):
+        return a - b
+    return map(subtract, a, b)
+
+
+def legacy_multiply_scalar(a, v):
+    """util.vector.multiply_scalar as it was, for `vector`."""
+    def multiply(v):
+        return a * v
+    return map(multiply, v)
+
+
+def legacy_divide_scalar(a, v):
+    """util.vector.divide_scalar as it was, for `vector`."""
+    def divide(v):
+        return v / float(a)
+    return map(divide, v)
+
+
+def legacy_normalize(v):
+    """util.vector.normalize as it was, for `vector`."""
+    x, y = v
+    magnitude = math.sqrt(x*x + y*y)
+    return legacy_divide_scalar(magnitude, v)
+
+
+def bench_vector(count):
+    """Aim [count] projectiles per call: old map chain, scalar, batched."""
+    rng = random.Random(count)
+    origins = [(rng.uniform(0, 800), rng.uniform(0, 450))
+               for _ in range(count)]
+    target = (400.0, 225.0)
+    aim = util.vector.aim
+    buffer = [0.0, 0.0]
+    origin_array = numpy.array(origins)
+    out = numpy.empty_like(origin_array)
+
+    def legacy():
+        # The chain Enemy.fire_projectile used before util.vector.aim()
+        for origin in origins:
+            tuple(legacy_multiply_scalar(0.2, legacy_normalize(
+                tuple(legacy_subtract(target, origin)))))
+
+    def scalar():
+        for origin in origins:
+            aim(origin, target, 0.2)
+
+    def in_place():
+        for origin in origins:
+            aim(origin, target, 0.2, buffer)
+
+    def batch():
+        util.vector.aim_many(origin_array, target, 0.2, out)
+    return {'legacy': legacy, 'scalar': scalar, 'in_place': in_place,
+            'batch': batch}
+
+
+def bench_env(count):
+    """VectorEnv.step over [count] games with random actions."""
+    vector_env = env.VectorEnv(count, seed=0)
+    vector_env.reset()
+    rng = numpy.random.default_rng(0)
+    actions = rng.integers(0, vector_env.action_count, size=(64, count))
+    steps = iter(range(1 << 62))
+
+    def tick():
+        vector_env.step(actions[next(steps) % 64])
+    # Let enemies spawn and fire first
+    for _ in range(300):
+        tick()
+    return {'default': tick}
+
+
+BENCHMARKS = {
+    'enemy_update': bench_enemy_update,
+    'archetypes': bench_archetypes,
+    'projectiles': bench_projectiles,
+    'collision_player': bench_collision_player,
+    'collision_enemy': bench_collision_enemy,
+    'broad_phase': bench_broad_phase,
+    'player_update': bench_player_update,
+    'view_draw': bench_view_draw,
+    'entities': bench_entities,
+    'vector': bench_vector,
+    'env': bench_env,
+}
+
+# Formats of the extra figures a benchmark's ticks can report
+EXTRAS = {
+    'bytes_per_entity': '{:.0f} B/entity',
+    'hit_rate': '{:.1%} cache hits',
+}
+
+
+def metadata():
+    """Return details identifying this run, for comparing results."""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pygame': pygame.version.ver,
+        'machine': platform.machine(),
+    }
+
+
+def run(names, counts, ticks):
+    """Run the benchmarks [names] at every count, printing as they go."""
+    results = []
+    print('{:<18} {:<12} {:>7} {:>12} {:>10} {:>10}'.format(
+        'benchmark', 'variant', 'count', 'ticks/s', 'p50 us', 'p99 us'))
+    for name in names:
+        for count in counts:
+            for variant, tick in sorted(BENCHMARKS[name](count).items()):
+                result = measure_ticks(tick, ticks)
+                result.update(benchmark=name, variant=variant, count=count)
+                # Extras are values, or callables read once timing is done
+                for key, value in getattr(tick, 'extra', {}).items():
+                    result[key] = value() if callable(value) else value
+                results.append(result)
+                print('{:<18} {:<12} {:>7} {:>12.1f} {:>10.1f} {:>10.1f}'
+                      .format(name, variant, count, result['throughput'],
+                              result['p50_us'], result['p99_us'])
+                      + ''.join('  ' + EXTRAS[key].format(result[key])
+                                for key in sorted(EXTRAS) if key in result))
+    return results
+
+
+def compare(results, baseline):
+    """Print the p50 latency of [results] relative to a [baseline] run."""
+    old = {(r['benchmark'], r['variant'], r['count']): r
+           for r in baseline['results']}
+    print('{:<18} {:<12} {:>7} {:>10} {:>10} {:>8}'.format(
+        'benchmark', 'variant', 'count', 'old p50', 'new p50', 'ratio'))
+    for result in results:
+        key = (result['benchmark'], result['variant'], result['count'])
+        if key in old:
+            before = old[key]['p50_us']
+            print('{:<18} {:<12} {:>7} {:>10.1f} {:>10.1f} {:>7.2f}x'.format(
+                key[0], key[1], key[2], before, result['p50_us'],
+                result['p50_us'] / before))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='any of: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--counts', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000],
+                        help='entity counts to run each benchmark at')
+    parser.add_argument('--ticks', type=int, default=200,
+                        help='timed ticks per benchmark run')
+    parser.add_argument('--output', metavar='PATH',
+                        help='save the results to PATH as JSON')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare with results saved by --output')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmark: ' + ', '.join(sorted(unknown)))
+    results = run(args.benchmarks or list(BENCHMARKS), args.counts,
+                  args.ticks)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,370 @@
+"""
+Gym-style environments for training bots on the game, headless.
+
+    env = env.GameEnv(seed=0)
+    observation, info = env.reset()
+    observation, reward, terminated, truncated, info = env.step(action)
+
+VectorEnv steps several independent games in lockstep and returns their
+observations stacked in one array.
+
+"""
+
+import random
+import numpy
+import controller
+import model
+
+SIZE = (800, 450)
+
+# (move_vec, hold) of each discrete action: stay or teleport in one of 8
+# directions, with the teleporter growing or held
+ACTIONS = [((x, y), hold) for hold in (False, True)
+           for y in (0, -1, 1) for x in (0, -1, 1)]
+
+
+class GameEnv:
+    """
+    One game behind a reset()/step(action) interface.
+
+    Observations are flat float32 arrays:
+        player     x, y over the arena size, teleporter radius over its max
+        enemies    [enemy_slots] nearest, each dx, dy over the arena size,
+                   cooldown fraction and 1 (all 0 for an empty slot)
+        projectiles [projectile_slots] nearest, each dx, dy over the arena
+                   size, velocity over the projectile speed and 1
+
+    The reward is the number of enemies destroyed in the step, minus
+    [death_penalty] when the player is hit.
+
+        Attributes:
+            [simulation]        SimulationController being played
+            [observation_size]  length of each observation
+            [action_count]      number of discrete actions, see ACTIONS
+            [max_ticks]         ticks before an episode is truncated
+
+    """
+
+    action_count = len(ACTIONS)
+
+    def __init__(self, seed=None, max_ticks=3600, enemy_slots=8,
+                 projectile_slots=16, death_penalty=1.0, size=SIZE):
+        """
+        Create game environment.
+
+            Parameters:
+                [seed]             (optional) seed of the first episode
+                [max_ticks]        (optional) episode length limit
+                [enemy_slots]      (optional) nearest enemies observed
+                [projectile_slots] (optional) nearest projectiles observed
+                [death_penalty]    (optional) reward lost on a hit
+                [size]             (optional) tuple (width, height) arena
+
+        """
+        self.random = random.Random(seed)
+        self.max_ticks = max_ticks
+        self.enemy_slots = enemy_slots
+        self.projectile_slots = projectile_slots
+        self.death_penalty = death_penalty
+        self.observation_size = 3 + 4 * enemy_slots + 5 * projectile_slots
+        self.input_source = controller.IdleInputController()
+        self.simulation = controller.SimulationController(
+            size, self.input_source, seed=seed)
+        self.scale = 1.0 / numpy.array(size, dtype=float)
+
+    def reset(self, seed=None):
+        """
+        Start a new episode and return (observation, info).
+
+            Parameters:
+                [seed] (optional) seed for the episode's RNG, drawn from
+                       the environment's own RNG by default
+
+        """
+        if seed is None:
+            seed = self.random.randrange(2**31)
+        self.simulation.enemy_controller.random.seed(seed)
+        self.simulation.reset()
+        return self.observe(), self.info()
+
+    def step(self, action):
+        """
+        Play [action] for one tick.
+
+        Returns (observation, reward, terminated, truncated, info). Once
+        either is True, call reset() before stepping again.
+
+            Parameters:
+                [action] index into ACTIONS
+
+        """
+        reward, terminated, truncated = self.advance(action)
+        return self.observe(), reward, terminated, truncated, self.info()
+
+    def advance(self, action):
+        """Play [action] for a tick, return (reward, terminated, truncated)."""
+        simulation = self.simulation
+        self.input_source.move_vec, self.input_source.hold = ACTIONS[action]
+        kills = simulation.kills
+        terminated = simulation.step()
+        reward = simulation.kills - kills
+        if terminated:
+            reward -= self.death_penalty
+        return reward, terminated, simulation.tick >= self.max_ticks
+
+    def info(self):
+        """Return the episode's running totals."""
+        return {'tick': self.simulation.tick, 'kills': self.simulation.kills}
+
+    def observe(self, out=None, rows=None):
+        """
+        Return the observation of the current state.
+
+            Parameters:
+                [out]  (optional) float32 array of [observation_size] to
+                       write into, a new one by default
+                [rows] (optional) rows of this game's projectiles in the
+                       store, all live rows by default
+
+        """
+        if out is None:
+            out = numpy.empty(self.observation_size, dtype=numpy.float32)
+        out.fill(0.0)
+        simulation = self.simulation
+        player = simulation.player_controller.player
+        teleporter = player.teleporter
+        center = player.rect.center
+        out[0:2] = center
+        out[0:2] *= self.scale
+        out[2] = teleporter.rect.width / float(teleporter.max)
+        # Nearest enemies
+        enemy_controller = simulation.enemy_controller
+        enemies = enemy_controller.enemies
+        start = 3
+        if enemies:
+            offsets, nearest = self.nearest(enemy_controller.geometry()[0],
+                                            center, self.enemy_slots)
+            slots = out[start:start + 4 * len(nearest)].reshape(-1, 4)
+            slots[:, 0:2] = offsets * self.scale
+            slots[:, 2] = [enemies[i].timer / enemies[i].cooldown
+                           for i in nearest.tolist()]
+            slots[:, 3] = 1.0
+        # Nearest projectiles
+        projectiles = enemy_controller.projectiles
+        if rows is None:
+            rows = slice(0, projectiles.count)
+        positions = projectiles.position[rows]
+        start += 4 * self.enemy_slots
+        if len(positions):
+            offsets, nearest = self.nearest(positions, center,
+                                            self.projectile_slots)
+            slots = out[start:start + 5 * len(nearest)].reshape(-1, 5)
+            slots[:, 0:2] = offsets * self.scale
+            slots[:, 2:4] = projectiles.velocity[rows][nearest] \
+                / enemy_controller.projectile_speed
+            slots[:, 4] = 1.0
+        return out
+
+    @staticmethod
+    def nearest(positions, center, k):
+        """Return (offsets, rows) of the [k] [positions] nearest [center]."""
+        offsets = positions - center
+        distances = numpy.einsum('ij,ij->i', offsets, offsets)
+        if len(distances) > k:
+            rows = numpy.argpartition(distances, k)[:k]
+            rows = rows[numpy.argsort(distances[rows])]
+        else:
+            rows = numpy.argsort(distances)
+        return offsets[rows], rows
+
+
+class VectorEnv:
+    """
+    [count] independent GameEnvs stepped in lockstep.
+
+    The games share one ProjectileStore, so every game's projectiles
+    move, cull and hit their own player in single NumPy passes instead of
+    one small pass per game. The rest is stepped game by game, in the
+    same order SimulationController.step() uses, so each game plays out
+    exactly as a lone GameEnv would. Don't step the [envs] directly.
+
+    Observations, rewards and flags come back as arrays with one row per
+    environment. An environment whose episode ends is reset at once, and
+    its row holds the first observation of the new episode.
+
+    """
+
+    def __init__(self, count, seed=None, **options):
+        """
+        Create vectorized environment.
+
+            Parameters:
+                [count]   number of environments
+                [seed]    (optional) seed, environment i gets [seed] + i
+                [options] (optional) GameEnv keyword arguments
+
+        """
+        self.envs = [GameEnv(None if seed is None else seed + i, **options)
+                     for i in range(count)]
+        self.projectiles = model.ProjectileStore()
+        for env in self.envs:
+            env.simulation.enemy_controller.projectiles = self.projectiles
+        simulation = self.envs[0].simulation
+        self.dt = simulation.dt
+        self.arena_rect = simulation.enemy_controller.arena_rect
+        self.action_count = GameEnv.action_count
+        self.observation_size = self.envs[0].observation_size
+        self.observations = numpy.zeros((count, self.observation_size),
+                                        dtype=numpy.float32)
+        self.rewards = numpy.zeros(count)
+        self.terminated = numpy.zeros(count, dtype=bool)
+        self.truncated = numpy.zeros(count, dtype=bool)
+
+    def __len__(self):
+        """Return the number of environments."""
+        return len(self.envs)
+
+    def reset(self):
+        """Reset every environment and return the stacked observations."""
+        for env in self.envs:
+            env.reset()
+        self.observe()
+        return self.observations
+
+    def step(self, actions):
+        """
+        Step environment i with [actions][i].
+
+        Returns (observations, rewards, terminated, truncated). The arrays
+        are reused by the next step, copy them to keep them.
+
+        """
+        dt = self.dt
+        envs = self.envs
+        for env, action in zip(envs, actions):
+            env.input_source.move_vec, env.input_source.hold = \
+                ACTIONS[action]
+            env.simulation.update_player(dt)
+        # Every game's projectiles at once
+        self.projectiles.update(dt)
+        self.projectiles.cull(self.arena_rect)
+        for i, env in enumerate(envs):
+            simulation = env.simulation
+            kills = simulation.kills
+            simulation.enemy_controller.update_enemies(
+                dt, simulation.player_controller.player)
+            simulation.collide_enemies()
+            self.rewards[i] = simulation.kills - kills
+        self.collide_players()
+        for i, env in enumerate(envs):
+            simulation = env.simulation
+            if self.terminated[i]:
+                simulation.game_over = True
+                self.rewards[i] -= env.death_penalty
+            self.truncated[i] = simulation.tick >= env.max_ticks
+            if self.terminated[i] or self.truncated[i]:
+                env.reset()
+        self.observe()
+        return self.observations, self.rewards, self.terminated, \
+            self.truncated
+
+    def games(self):
+        """Return the index of the game each live projectile belongs to."""
+        ids = []
+        games = []
+        for i, env in enumerate(self.envs):
+            enemies = env.simulation.enemy_controller.enemies
+            ids.extend([enemy.id for enemy in enemies])
+            games.extend([i] * len(enemies))
+        ids = numpy.array(ids, dtype=numpy.int64)
+        order = numpy.argsort(ids)
+        owners = self.projectiles.owner[:self.projectiles.count]
+        return numpy.array(games, dtype=numpy.intp)[order][
+            numpy.searchsorted(ids[order], owners)]
+
+    def collide_players(self):
+        """Set [terminated] for the games whose player was hit."""
+        self.terminated[:] = False
+        n = self.projectiles.count
+        if not n:
+            return
+        rects = [env.simulation.player_controller.player.rect
+                 for env in self.envs]
+        # Same arithmetic as ProjectileStore.overlaps()
+        halves = numpy.array([(rect.width / 2.0, rect.height / 2.0)
+                              for rect in rects])
+        centers = numpy.array([(rect.left, rect.top) for rect in rects])
+        centers += halves
+        games = self.games()
+        offsets = self.projectiles.position[:n] - centers[games]
+        numpy.abs(offsets, out=offsets)
+        offsets -= self.projectiles.size[:n] * 0.5
+        hits = offsets < halves[games]
+        self.terminated[games[hits[:, 0] & hits[:, 1]]] = True
+
+    def observe(self):
+        """Write every game's observation into [observations], at once."""
+        first = self.envs[0]
+        count = len(self.envs)
+        out = self.observations
+        out.fill(0.0)
+        players = [env.simulation.player_controller.player
+                   for env in self.envs]
+        centers = numpy.array([player.rect.center for player in players])
+        out[:, 0:2] = centers * first.scale
+        out[:, 2] = [player.teleporter.rect.width
+                     / float(player.teleporter.max) for player in players]
+        # Nearest enemies of each game
+        controllers = [env.simulation.enemy_controller for env in self.envs]
+        enemies = [enemy for controller in controllers
+                   for enemy in controller.enemies]
+        start = 3
+        if enemies:
+            games = numpy.repeat(numpy.arange(count),
+                                 [len(c.enemies) for c in controllers])
+            positions = numpy.concatenate([c.geometry()[0]
+                                           for c in controllers])
+            slots = out[:, start:start + 4 * first.enemy_slots].reshape(
+                count, first.enemy_slots, 4)
+            rows, games, ranks, offsets = self.nearest(
+                games, positions, centers, first.enemy_slots)
+            slots[games, ranks, 0:2] = offsets * first.scale
+            slots[games, ranks, 2] = [enemies[i].timer / enemies[i].cooldown
+                                      for i in rows.tolist()]
+            slots[games, ranks, 3] = 1.0
+        # Nearest projectiles of each game
+        projectiles = self.projectiles
+        n = projectiles.count
+        start += 4 * first.enemy_slots
+        if n:
+            slots = out[:, start:start + 5 * first.projectile_slots].reshape(
+                count, first.projectile_slots, 5)
+            rows, games, ranks, offsets = self.nearest(
+                self.games(), projectiles.position[:n], centers,
+                first.projectile_slots)
+            slots[games, ranks, 0:2] = offsets * first.scale
+            slots[games, ranks, 2:4] = projectiles.velocity[rows] \
+                / controllers[0].projectile_speed
+            slots[games, ranks, 4] = 1.0
+
+    @staticmethod
+    def nearest(games, positions, centers, k):
+        """
+        Return (rows, games, ranks, offsets) of the [k] nearest per game.
+
+            Parameters:
+                [games]     game index of each position
+                [positions] float array (n, 2)
+                [centers]   float array (count, 2) of each game's player
+                [k]         positions kept per game
+
+        """
+        offsets = positions - centers[games]
+        distances = numpy.einsum('ij,ij->i', offsets, offsets)
+        order = numpy.lexsort((distances, games))
+        games = games[order]
+        starts = numpy.searchsorted(games, numpy.arange(len(centers)))
+        ranks = numpy.arange(len(order)) - starts[games]
+        keep = ranks < k
+        rows = order[keep]
+        return rows, games[keep], ranks[keep], offsets[rows]
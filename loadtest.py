@@ -0,0 +1,174 @@
+"""
+Load test for server.py: many bot clients over localhost.
+
+    python loadtest.py --bots 200 --duration 10 --spawn-server
+
+Every bot plays RandomInputController input and counts the snapshot
+bytes it receives; with --decode it also rebuilds its entity tables, as
+a real client would. One task sends every bot's input each tick, so the
+bots themselves cost little next to the server being measured. A
+spawned server gets a --world-size arena, 4000x3000 by default, so each
+bot only sees the part of it around its own player.
+
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import time
+import controller
+import protocol
+import replay
+
+
+class Bot:
+    """
+    One client connection played by a RandomInputController.
+
+        Attributes:
+            [player_id] id of the bot's player, once connected
+            [received]  snapshot bytes received
+            [snapshots] snapshots received
+            [entities]  entities held after the last snapshot, if decoded
+
+    """
+
+    def __init__(self, seed, decode=False):
+        """
+        Create new, unconnected Bot.
+
+            Parameters:
+                [seed]   seed of the bot's input
+                [decode] (optional) True to apply the snapshots
+
+        """
+        self.input_source = controller.RandomInputController(seed)
+        self.decoder = protocol.SnapshotDecoder() if decode else None
+        self.player_id = None
+        self.writer = None
+        self.received = 0
+        self.snapshots = 0
+        self.entities = 0
+
+    async def connect(self, host, port):
+        """Connect and read the HELLO, return the tick time in s."""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        hello = await protocol.read_frame(self.reader)
+        _, self.player_id, _, _, dt = protocol.HELLO_BODY.unpack(hello)
+        return dt / 1000.0
+
+    def send_input(self):
+        """Send this tick's input if it does anything."""
+        self.input_source.poll()
+        byte = replay.encode_input(self.input_source)
+        # Idle is what the server assumes when no input arrives
+        if byte & ~replay.RESTART:
+            self.writer.write(bytes((byte,)))
+
+    async def receive(self):
+        """Read snapshots until the connection closes."""
+        try:
+            while True:
+                payload = await protocol.read_frame(self.reader)
+                self.received += protocol.FRAME.size + len(payload)
+                self.snapshots += 1
+                if self.decoder:
+                    self.decoder.apply(payload)
+                    self.entities = sum(
+                        len(ids) for ids, _ in self.decoder.tables.values())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+async def run(host, port, bot_count, duration, decode=False,
+              connect_rate=200.0):
+    """
+    Connect [bot_count] bots, play for [duration] s and print a report.
+
+        Parameters:
+            [connect_rate] (optional) new connections per second, so the
+                           server isn't flooded with connects at once
+
+    """
+    bots = [Bot(seed, decode) for seed in range(bot_count)]
+    dt = None
+    for bot in bots:
+        dt = await bot.connect(host, port)
+        await asyncio.sleep(1.0 / connect_rate)
+    receivers = [asyncio.ensure_future(bot.receive()) for bot in bots]
+    start = time.perf_counter()
+    counted = [(bot.received, bot.snapshots) for bot in bots]
+    while time.perf_counter() - start < duration:
+        for bot in bots:
+            bot.send_input()
+        await asyncio.sleep(dt)
+    elapsed = time.perf_counter() - start
+    received = sum(bot.received - before for bot, (before, _)
+                   in zip(bots, counted))
+    snapshots = sum(bot.snapshots - before for bot, (_, before)
+                    in zip(bots, counted))
+    for bot in bots:
+        bot.writer.close()
+    await asyncio.gather(*receivers)
+    print('{} bots for {:.1f}s: {:.1f} snapshots/s and {:.2f} kB/s per bot, '
+          '{:.0f} B per snapshot'.format(
+              bot_count, elapsed, snapshots / elapsed / bot_count,
+              received / 1024.0 / elapsed / bot_count,
+              received / max(snapshots, 1)))
+    if decode:
+        entities = collections.Counter(bot.entities for bot in bots)
+        print('entities in view per bot: mean {:.1f}, max {}'.format(
+            sum(n * count for n, count in entities.items()) / bot_count,
+            max(entities)))
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Load test server.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--bots', type=int, default=100,
+                        help='number of bot connections')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds to play once every bot is connected')
+    parser.add_argument('--decode', action='store_true',
+                        help='apply the snapshots like a real client')
+    parser.add_argument('--spawn-server', action='store_true',
+                        help='start server.py for the test and print its '
+                             'reports')
+    parser.add_argument('--world-size', default='4000x3000',
+                        metavar='WxH', help='arena size of the spawned '
+                                            'server')
+    parser.add_argument('--enemies-per-player', default='2',
+                        help='most enemies per live player in the spawned '
+                             'server')
+    parser.add_argument('--server-args', default='',
+                        help='extra arguments for the spawned server, '
+                             "e.g. '--snapshot-rate 10'")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = None
+    if args.spawn_server:
+        server = subprocess.Popen(
+            [sys.executable,
+             os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'server.py'), '--host', args.host,
+             '--port', str(args.port), '--world-size', args.world_size,
+             '--enemies-per-player', args.enemies_per_player]
+            + args.server_args.split(),
+            stdout=subprocess.PIPE, text=True)
+        # Wait until it is listening
+        print(server.stdout.readline(), end='')
+    try:
+        asyncio.run(run(args.host, args.port, args.bots, args.duration,
+                        args.decode))
+    finally:
+        if server:
+            server.terminate()
+            print(''.join(server.stdout.readlines()[-5:]), end='')
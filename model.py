@@ -1,10 +1,15 @@
 """Models for the game."""
 
-import pygame
+import itertools
 import math
+import numpy
+import archetypes
+import util.lazy
 import util.rect
-import util.vector
-import view
+
+# Only needed to draw, so headless runs never import them
+pygame = util.lazy.module('pygame')
+view = util.lazy.module('view')
 
 
 class Teleporter:
@@ -12,13 +17,15 @@ class Teleporter:
     Teleporter box around the Player.
 
         Attributes:
-            [rect]      Rect object
+            [rect]      FloatRect object
             [period]    time it takes for one oscillation (expand & contract)
             [span]      tuple (min, max) span of the teleporter Rect's length
             [direction] [1|-1] where 1=expanding, -1=contracting
 
     """
 
+    __slots__ = ('span', 'min', 'max', 'rect', 'period', 'velocity')
+
     def __init__(self, center, size):
         """
         Create new Teleporter.
@@ -32,38 +39,34 @@ class Teleporter:
 
         """
         self.span = self.min, self.max = 20, 200
-        self.rect = util.rect.create(center, size)
+        self.rect = util.rect.FloatRect(center, size)
         self.period = 1600
         self.velocity = 0.33
 
     def reset(self):
         """Reset teleporter to [min] length."""
-        tmp_center = self.rect.center
         self.rect.width = self.min
         self.rect.height = self.min
-        self.rect.center = tmp_center
 
     def grow(self, dt):
         """Expand the teleporter."""
-        tmp_center = self.rect.center
-        self.rect.width += dt*self.velocity
-        self.rect.height += dt*self.velocity
+        rect = self.rect
+        rect.width += dt*self.velocity
+        rect.height += dt*self.velocity
         # Check [max] bound
-        if self.rect.width > self.max or self.rect.height > self.max:
-            self.rect.width = self.max
-            self.rect.height = self.max
-        self.rect.center = tmp_center
+        if rect.width > self.max or rect.height > self.max:
+            rect.width = self.max
+            rect.height = self.max
 
     def shrink(self, dt):
         """Contract the teleporter."""
-        tmp_center = self.rect.center
-        self.rect.width -= dt*self.velocity
-        self.rect.height -= dt*self.velocity
+        rect = self.rect
+        rect.width -= dt*self.velocity
+        rect.height -= dt*self.velocity
         # Check [min] bound
-        if self.rect.width < self.min or self.rect.height < self.min:
-            self.rect.width = self.min
-            self.rect.height = self.min
-        self.rect.center = tmp_center
+        if rect.width < self.min or rect.height < self.min:
+            rect.width = self.min
+            rect.height = self.min
 
     def calculate_length(self, t):
         """
@@ -96,31 +99,131 @@ class Teleporter:
         # Re-center [rect]
         self.rect.center = center
 
-    def draw(self, surface):
-        """Draw self to the [surface]."""
+    def draw(self, surface, offset=(0, 0)):
+        """Draw self to the [surface] and return the Rect drawn over."""
         stroke_width = 1
-        pygame.draw.circle(surface, view.Color.blue, self.rect.center,
-                           int(self.rect.width/2.0), stroke_width)
+        return view.surface_cache.blit_circle(
+            surface, view.Color.blue, self.rect.center,
+            int(self.rect.width/2.0), stroke_width, offset=offset
+        )
         # pygame.draw.rect(surface, view.Color.blue, self.rect, stroke_width)
 
 
-class DecayingTeleporter:
-    """A decaying teleporter left behind after the player moves."""
+class TrailBuffer:
+    """
+    Fixed-capacity ring buffer of the teleporter circles left behind.
+
+    The player leaves one each tick it moves. Entries are stored oldest
+    first in preallocated arrays, so adding one allocates nothing,
+    expiring only looks at the expired entries and one more, and they
+    draw in one blits() call.
+    Once [capacity] are alive the oldest is overwritten.
+
+        Attributes:
+            [clock]      TimerQueue whose time the trail decays on
+            [decay_time] time in ms an entry stays visible
+            [start]      row of the oldest live entry
+            [count]      number of live entries
+            [center]     float array (capacity, 2) of circle centers
+            [size]       float array (capacity, 2) of (width, height)
+            [created_at] float array (capacity,) time each was left
+
+    """
+
+    # Distinct opacities drawn while fading out
+    alpha_steps = 8
+
+    def __init__(self, clock, capacity=128, decay_time=100):
+        """
+        Create new, empty TrailBuffer.
+
+            Parameters:
+                [clock]      TimerQueue whose time the trail decays on
+                [capacity]   (optional) most entries alive at once
+                [decay_time] (optional) time in ms an entry stays
 
-    def __init__(self, teleporter):
-        """Create new decaying teleporter."""
-        self.rect = pygame.Rect(teleporter.rect.topleft, teleporter.rect.size)
-        self.decay_time = 100
-        self.timer = 0
+        """
+        self.clock = clock
+        self.decay_time = decay_time
+        self.start = 0
+        self.count = 0
+        self.center = numpy.zeros((capacity, 2))
+        self.size = numpy.zeros((capacity, 2))
+        self.created_at = numpy.zeros(capacity)
+
+    def __len__(self):
+        """Return the number of live entries."""
+        return self.count
+
+    def clear(self):
+        """Remove every entry, keeping the allocated arrays."""
+        self.start = 0
+        self.count = 0
+
+    def rows(self):
+        """Return the rows of the live entries, oldest first."""
+        capacity = len(self.created_at)
+        return (self.start + numpy.arange(self.count)) % capacity
+
+    def add(self, rect):
+        """Leave a copy of the [rect] behind, starting its decay now."""
+        capacity = len(self.created_at)
+        if self.count == capacity:
+            self.start = (self.start + 1) % capacity
+            self.count -= 1
+        i = (self.start + self.count) % capacity
+        self.center[i] = rect.center
+        self.size[i] = rect.size
+        self.created_at[i] = self.clock.now
+        self.count += 1
+
+    def expire(self):
+        """Drop the entries older than [decay_time]."""
+        # Oldest first, so the expired entries are a prefix: walk to where
+        # it ends, one comparison per expired entry (usually 0 or 1 a tick,
+        # cheaper than a NumPy pass over them all), and move [start] past
+        # it without touching the live ones
+        capacity = len(self.created_at)
+        oldest = self.clock.now - self.decay_time
+        expired = 0
+        while (expired < self.count and self.created_at[
+                (self.start + expired) % capacity] < oldest):
+            expired += 1
+        self.start = (self.start + expired) % capacity
+        self.count -= expired
+
+    def draw(self, surface, offset=(0, 0), view_rect=None):
+        """
+        Draw every live entry on the [surface], return the Rects drawn over.
 
-    def draw(self, surface):
-        """Draw self to the [surface]."""
-        # alpha = int(255.0 * (1.0 - float(self.timer)/self.decay_time))
-        # stroke_color = pygame.Color(0, 0, 255, alpha)
+            Parameters:
+                [offset]    (optional) int (x, y) camera offset
+                [view_rect] (optional) visible part of the world, only
+                            entries overlapping it are drawn
+
+        """
+        rows = self.rows()
+        if view_rect is not None:
+            distance = numpy.abs(self.center[rows] - view_rect.center)
+            distance -= self.size[rows] / 2.0
+            rows = rows[(distance < (view_rect.width / 2.0,
+                                     view_rect.height / 2.0)).all(1)]
+        # Fade out, in [alpha_steps] cached steps
+        fade = 1.0 - (self.clock.now - self.created_at[rows]) \
+            / self.decay_time
+        alphas = numpy.ceil(fade * self.alpha_steps) * 255 // self.alpha_steps
+        radii = (self.size[rows, 0] / 2.0).astype(int)
+        corners = self.center[rows].astype(int) - offset
+        corners -= (radii + 1)[:, None]
+        circle = view.surface_cache.circle
+        color = view.Color.blue
         stroke_width = 1
-        # pygame.draw.rect(surface, view.Color.blue, self.rect, stroke_width)
-        pygame.draw.circle(surface, view.Color.blue, self.rect.center,
-                           int(self.rect.width/2.0), stroke_width)
+        return surface.blits(
+            [(circle(color, radius, stroke_width, max(alpha, 0)), corner)
+             for radius, alpha, corner in zip(radii.tolist(),
+                                              alphas.astype(int).tolist(),
+                                              corners.tolist())]
+        )
 
 
 class Player:
@@ -128,11 +231,13 @@ class Player:
     Main player in the game.
 
         Attributes:
-            [rect]       Rect object
+            [rect]       FloatRect object
             [teleporter] Teleporter object
 
     """
 
+    __slots__ = ('rect', 'teleporter')
+
     def __init__(self, center, size):
         """
         Create new Player.
@@ -142,7 +247,7 @@ class Player:
                 [size]   tuple (width, height)
 
         """
-        self.rect = util.rect.create(center, size)
+        self.rect = util.rect.FloatRect(center, size)
         self.teleporter = Teleporter(center, size)
 
     def move(self, vec):
@@ -173,88 +278,289 @@ class Player:
         """
         self.teleporter.update(dt, self.rect.center)
 
-    def draw(self, surface):
-        """Draw self on the [surface]."""
+    def draw(self, surface, offset=(0, 0)):
+        """Draw self on the [surface] and return the Rect drawn over."""
         # pygame.draw.rect(surface, view.Color.black, self.rect)
-        pygame.draw.circle(surface, view.Color.black, self.rect.center,
-                           int(self.rect.width/2.0))
-        self.teleporter.draw(surface)
+        dirty = view.surface_cache.blit_circle(
+            surface, view.Color.black, self.rect.center,
+            int(self.rect.width/2.0), offset=offset
+        )
+        return dirty.union(self.teleporter.draw(surface, offset))
 
 
-class Projectile:
-    """Base class for a projectile."""
+class ProjectileStore:
+    """
+    Structure-of-arrays storage for every live projectile.
 
-    def __init__(self, center, size, velocity):
-        """Create new Projectile."""
-        self.rect = util.rect.create(center, size)
-        self.velocity = velocity
+    Live projectiles are packed into the first [count] rows of each array,
+    so all of them advance, cull and collide in one NumPy operation. Each
+    of those costs a few us however few rows it touches, which a
+    single-player game, with about a dozen projectiles alive, pays many
+    times a tick; below [small] live rows overlaps() loops in Python
+    instead and an empty store skips its updates.
 
-    def update(self, dt):
-        """Update bullet position by [velocity] over time [dt]."""
-        dx, dy = util.vector.multiply_scalar(dt, self.velocity)
-        self.rect.move_ip(dx, dy)
+        Attributes:
+            [count]    number of live projectiles
+            [position] float array (capacity, 2) of projectile centers
+            [previous] float array (capacity, 2) of centers before the
+                       last update, for render interpolation
+            [velocity] float array (capacity, 2) in px per ms
+            [size]     float array (capacity, 2) of (width, height)
+            [owner]    int array (capacity,) id of the Enemy that fired
+            [id]       int array (capacity,) unique id of each projectile,
+                       e.g. to match them across network snapshots
+            [next_id]  id the next spawned projectile gets
 
-    def draw(self, surface):
-        """Draw self on the [surface]."""
-        pygame.draw.rect(surface, view.Color.red, self.rect)
+    """
 
+    # Fewest live rows overlaps() tests with NumPy rather than in Python
+    small = 16
 
-class Enemy:
-    """Base class for an enemy."""
+    def __init__(self, capacity=256):
+        """
+        Create new, empty ProjectileStore.
+
+            Parameters:
+                [capacity] (optional) initial number of preallocated rows
 
-    def __init__(self, center, size, cooldown=1600):
         """
-        Create new Enemy.
+        self.count = 0
+        self.position = numpy.zeros((capacity, 2))
+        self.previous = numpy.zeros((capacity, 2))
+        self.velocity = numpy.zeros((capacity, 2))
+        self.size = numpy.zeros((capacity, 2))
+        self.owner = numpy.zeros(capacity, dtype=numpy.int64)
+        self.id = numpy.zeros(capacity, dtype=numpy.int64)
+        self.next_id = 0
+
+    def __len__(self):
+        """Return the number of live projectiles."""
+        return self.count
+
+    def clear(self):
+        """Remove every projectile, keeping the allocated arrays."""
+        self.count = 0
+
+    def spawn(self, center, size, velocity, owner=-1):
+        """
+        Add a projectile and return its row.
 
             Parameters:
                 [center]   tuple (x, y)
                 [size]     tuple (width, height)
-                [cooldown] time between shots
+                [velocity] tuple (dx, dy) in px per ms
+                [owner]    (optional) id of the Enemy that fired it
 
         """
-        self.rect = util.rect.create(center, size)
-        self.cooldown = cooldown
-        self.timer = 0
-        self.projectiles = []
+        if self.count == len(self.owner):
+            self.grow(2 * len(self.owner))
+        i = self.count
+        self.position[i] = center
+        self.previous[i] = center
+        self.size[i] = size
+        self.velocity[i] = velocity
+        self.owner[i] = owner
+        self.id[i] = self.next_id
+        self.next_id += 1
+        self.count += 1
+        return i
+
+    def spawn_many(self, centers, sizes, velocities, owners):
+        """
+        Add a projectile per row of the arrays, return the rows they got.
+
+            Parameters:
+                [centers]    float array (n, 2)
+                [sizes]      float array (n, 2) of (width, height)
+                [velocities] float array (n, 2) in px per ms
+                [owners]     int array (n,) of the Enemy ids that fired
+
+        """
+        n = len(centers)
+        start = self.count
+        if start + n > len(self.owner):
+            self.grow(max(2 * len(self.owner), start + n))
+        rows = slice(start, start + n)
+        self.position[rows] = centers
+        self.previous[rows] = centers
+        self.size[rows] = sizes
+        self.velocity[rows] = velocities
+        self.owner[rows] = owners
+        self.id[rows] = numpy.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        self.count += n
+        return rows
+
+    def grow(self, capacity):
+        """Reallocate the arrays to hold [capacity] projectiles."""
+        n = self.count
+        for name in ('position', 'previous', 'velocity', 'size', 'owner',
+                     'id'):
+            old = getattr(self, name)
+            new = numpy.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
 
     def update(self, dt):
+        """Move every projectile by its [velocity] over time [dt]."""
+        n = self.count
+        if n == 0:
+            return
+        self.previous[:n] = self.position[:n]
+        self.position[:n] += self.velocity[:n] * dt
+
+    def overlaps(self, rect, rows=None):
         """
-        Update Enemy.
+        Return a mask of the projectiles overlapping the [rect].
 
             Parameters:
-                [dt] elapsed time in ms
+                [rect] Rect to test against
+                [rows] (optional) candidate rows, all live rows by default
 
         """
-        # Update timer - TODO: make all this logic in a controller later
-        self.timer += dt
-
-    def fire_projectile(self, target, speed=0.2):
+        half_width = rect.width / 2.0
+        half_height = rect.height / 2.0
+        center_x = rect.left + half_width
+        center_y = rect.top + half_height
+        if rows is None:
+            n = self.count
+            if n < self.small:
+                # Same arithmetic as below, so the same results
+                return numpy.array(
+                    [abs(x - center_x) - width * 0.5 < half_width
+                     and abs(y - center_y) - height * 0.5 < half_height
+                     for (x, y), (width, height) in zip(
+                         self.position[:n].tolist(),
+                         self.size[:n].tolist())],
+                    dtype=bool)
+            rows = slice(0, n)
+        x = self.position[rows, 0] - center_x
+        y = self.position[rows, 1] - center_y
+        numpy.abs(x, out=x)
+        numpy.abs(y, out=y)
+        x -= self.size[rows, 0] * 0.5
+        y -= self.size[rows, 1] * 0.5
+        return (x < half_width) & (y < half_height)
+
+    def collide_rect(self, rect, rows=None):
+        """Return rows of the projectiles overlapping the [rect]."""
+        hits = numpy.flatnonzero(self.overlaps(rect, rows))
+        return hits if rows is None else rows[hits]
+
+    def cull(self, rect):
+        """Remove projectiles that no longer overlap the [rect]."""
+        self.keep(self.overlaps(rect))
+
+    def remove_owners(self, owners):
+        """Remove projectiles fired by any Enemy id in [owners]."""
+        n = self.count
+        self.keep(~numpy.isin(self.owner[:n], list(owners)))
+
+    def keep(self, mask):
+        """Compact the live rows, keeping those where [mask] is True."""
+        n = int(numpy.count_nonzero(mask))
+        if n == self.count:
+            return
+        for array in (self.position, self.previous, self.velocity,
+                      self.size, self.owner, self.id):
+            array[:n] = array[:self.count][mask]
+        self.count = n
+
+    def draw(self, surface, alpha=1.0, offset=(0, 0), view_rect=None):
         """
-        Fire a projectile at the [target] with [speed].
+        Draw every projectile on the [surface], return the Rects drawn over.
 
             Parameters:
-                [target] tuple (x, y) coordinates the projectile is aiming at
-                [speed] optional projectile speed
+                [alpha]     (optional) blend from the previous position (0)
+                            to the current one (1)
+                [offset]    (optional) int (x, y) camera offset
+                [view_rect] (optional) visible part of the world, only
+                            projectiles overlapping it are drawn
 
         """
-        p_size = util.vector.divide_scalar(2.0, self.rect.size)
-        p_velocity = util.vector.multiply_scalar(
-            speed,
-            util.vector.normalize(
-                util.vector.subtract(target, self.rect.center)
-            )
+        rows = slice(0, self.count)
+        if view_rect is not None:
+            rows = self.collide_rect(view_rect)
+        corners = self.previous[rows] - self.size[rows] / 2.0
+        corners += (self.position[rows] - self.previous[rows]) * alpha
+        corners -= offset
+        sizes = self.size[rows].astype(int).tolist()
+        shape = view.surface_cache.rect
+        color = view.Color.red
+        return surface.blits(
+            [(shape(color, tuple(size)), corner)
+             for corner, size in zip(corners.tolist(), sizes)]
         )
-        # Create and append
-        projectile = Projectile(self.rect.center, p_size, p_velocity)
-        # Reset [timer]
-        self.timer = 0
-        # Return projectile
-        self.projectiles.append(projectile)
-        return projectile
-
-    def draw(self, surface):
-        """Draw self on the [surface]."""
-        pygame.draw.rect(surface, view.Color.red, self.rect)
+
+
+class Enemy:
+    """
+    Base class for an enemy.
+
+    What it does is up to its [archetype], see archetypes.py; the
+    EnemyController moves and fires all enemies of an archetype at once.
+
+        Attributes:
+            [id]          unique id, the owner of this Enemy's projectiles
+            [projectiles] shared ProjectileStore this Enemy fires into
+            [clock]       shared TimerQueue the cooldown runs on
+            [fired_at]    time in ms of the last volley, or of the spawn
+            [archetype]   Archetype it behaves as
+            [health]      ms it survives inside the teleporter
+            [burst]       volleys fired so far in the current burst
+            [spawned_at]  time in ms it spawned
+            [anchor]      tuple (x, y) it moves around, see Archetype
+            [heading]     tuple (x, y) it moves by, see Archetype
+
+    """
+
+    __slots__ = ('id', 'rect', 'cooldown', 'fired_at', 'projectiles',
+                 'clock', 'archetype', 'health', 'burst', 'spawned_at',
+                 'anchor', 'heading')
+
+    ids = itertools.count()
+
+    def __init__(self, center, size, projectiles, clock, cooldown=1600,
+                 archetype=archetypes.DEFAULT):
+        """
+        Create new Enemy.
+
+            Parameters:
+                [center]      tuple (x, y)
+                [size]        tuple (width, height)
+                [projectiles] ProjectileStore to fire into
+                [clock]       TimerQueue the cooldown runs on
+                [cooldown]    time between volleys
+                [archetype]   (optional) Archetype, a plain one by default
+
+        """
+        self.id = next(Enemy.ids)
+        self.rect = util.rect.FloatRect(center, size)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.fired_at = clock.now
+        self.projectiles = projectiles
+        self.archetype = archetype
+        self.health = archetype.health
+        self.burst = 0
+        self.spawned_at = clock.now
+        self.anchor = center
+        self.heading = (0.0, 0.0)
+
+    @property
+    def timer(self):
+        """Time in ms since the last shot."""
+        return self.clock.now - self.fired_at
+
+    @timer.setter
+    def timer(self, timer):
+        self.fired_at = self.clock.now - timer
+
+    def draw(self, surface, offset=(0, 0)):
+        """Draw self on the [surface] and return the Rect drawn over."""
+        color = self.archetype.color
+        dirty = view.surface_cache.blit_rect(surface, color, self.rect,
+                                             offset=offset)
         # draw cooldown indicator
         frac = float(self.timer) / float(self.cooldown)
         radius = self.rect.width/2.0 + 1.5 * self.rect.width * (1.0 - frac)
@@ -262,4 +568,7 @@ class Enemy:
             radius = 1
         cooldown_rect = pygame.Rect((0, 0), (2*radius, 2*radius))
         cooldown_rect.center = self.rect.center
-        pygame.draw.rect(surface, view.Color.red, cooldown_rect, 1)
+        return dirty.union(
+            view.surface_cache.blit_rect(surface, color, cooldown_rect, 1,
+                                         offset)
+        )
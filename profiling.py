@@ -0,0 +1,174 @@
+"""Opt-in per-phase profiling of the game loop."""
+
+import json
+import sys
+import time
+import numpy
+import util.lazy
+
+# Only the on-screen overlay draws
+pygame = util.lazy.module('pygame')
+
+
+class NullProfiler:
+    """Profiler that records nothing, the default when profiling is off."""
+
+    enabled = False
+
+    def begin(self):
+        """Do nothing."""
+        pass
+
+    def mark(self, phase):
+        """Do nothing."""
+        pass
+
+    def commit(self, enemy_count, projectile_count, trail_count):
+        """Do nothing."""
+        pass
+
+
+class Profiler:
+    """
+    Records per-phase timings and entity counts into a ring buffer.
+
+    A row covers everything between begin() and commit(): a frame in the
+    windowed game or a tick when headless. The first row starts at the
+    first begin(), so setup time is left out; commit() begins the next.
+    Each mark(phase) charges the time since the previous mark to that
+    [phase].
+
+        Attributes:
+            [columns] names of the recorded columns
+            [rows]    float array (capacity, len(columns)) ring buffer
+            [count]   number of rows committed so far
+
+    """
+
+    enabled = True
+    phases = ('input', 'player', 'enemy', 'collision_enemy',
+              'collision_player', 'draw')
+    columns = (('time', 'ticks') + tuple(p + '_ms' for p in phases)
+               + ('total_ms', 'enemies', 'projectiles', 'trail',
+                  'allocated_blocks'))
+
+    def __init__(self, capacity=3600):
+        """
+        Create new, empty Profiler.
+
+            Parameters:
+                [capacity] (optional) rows kept before the oldest is
+                           overwritten
+
+        """
+        self.rows = numpy.zeros((capacity, len(self.columns)))
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.count = 0
+        self.start_time = None
+
+    def begin(self):
+        """Start a new row, the first one starts the clock."""
+        self.row = [0.0] * len(self.columns)
+        self.blocks = sys.getallocatedblocks()
+        self.row_start = self.last = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = self.row_start
+
+    def mark(self, phase):
+        """Charge the time since the last mark to [phase]."""
+        time_now = time.perf_counter()
+        self.row[self.index[phase + '_ms']] += (time_now - self.last) * 1e3
+        self.last = time_now
+        if phase == 'input':
+            self.row[1] += 1  # every tick polls input once
+
+    def commit(self, enemy_count, projectile_count, trail_count):
+        """Finish the row with the current entity counts."""
+        row = self.row
+        row[0] = (self.row_start - self.start_time) * 1e3
+        row[-5] = (self.last - self.row_start) * 1e3
+        row[-4] = enemy_count
+        row[-3] = projectile_count
+        row[-2] = trail_count
+        row[-1] = sys.getallocatedblocks() - self.blocks
+        self.rows[self.count % len(self.rows)] = row
+        self.count += 1
+        self.begin()
+
+    def history(self):
+        """Return the rows still in the ring buffer, oldest first."""
+        capacity = len(self.rows)
+        if self.count <= capacity:
+            return self.rows[:self.count]
+        split = self.count % capacity
+        return numpy.concatenate((self.rows[split:], self.rows[:split]))
+
+    def summary(self, last=60):
+        """Return {column: mean} over the [last] rows."""
+        rows = self.history()[-last:]
+        if len(rows) == 0:
+            return {name: 0.0 for name in self.columns}
+        return dict(zip(self.columns, rows.mean(axis=0).tolist()))
+
+    def export(self, path):
+        """Write the history to [path], as JSON for .json else as CSV."""
+        rows = self.history()
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'columns': list(self.columns),
+                           'rows': rows.tolist()}, f)
+        else:
+            numpy.savetxt(path, rows, fmt=self.formats(), delimiter=',',
+                          header=','.join(self.columns), comments='')
+
+    def formats(self):
+        """Return the CSV format of each column, counts as integers."""
+        return ['%.4f' if name == 'time' or name.endswith('_ms') else '%d'
+                for name in self.columns]
+
+
+class ProfilerOverlay:
+    """On-screen readout of a Profiler's recent averages."""
+
+    def __init__(self, profiler, position=(8, 8), refresh=30):
+        """
+        Create new ProfilerOverlay.
+
+            Parameters:
+                [profiler] Profiler to read
+                [position] (optional) tuple (x, y) of the top left corner
+                [refresh]  (optional) frames between text updates
+
+        """
+        self.profiler = profiler
+        self.position = position
+        self.refresh = refresh
+        pygame.font.init()
+        self.font = pygame.font.Font(None, 18)
+        self.frames = 0
+        self.surface = None
+
+    def render(self):
+        """Render the profiler summary to a new surface."""
+        summary = self.profiler.summary()
+        lines = ['{:<17}{:7.3f} ms'.format(phase, summary[phase + '_ms'])
+                 for phase in self.profiler.phases]
+        lines.append('{:<17}{:7.3f} ms'.format('total',
+                                                summary['total_ms']))
+        for name in ('ticks', 'enemies', 'projectiles', 'trail',
+                     'allocated_blocks'):
+            lines.append('{:<17}{:7.1f}'.format(name, summary[name]))
+        height = self.font.get_linesize()
+        surface = pygame.Surface((200, height * len(lines)))
+        surface.fill((255, 255, 255))
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, (0, 0, 0)),
+                         (0, i * height))
+        return surface
+
+    def draw(self, surface):
+        """Draw the overlay on the [surface] and return the Rect drawn over."""
+        if self.surface is None or self.frames % self.refresh == 0:
+            self.surface = self.render()
+        self.frames += 1
+        return surface.blit(self.surface, self.position)
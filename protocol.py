@@ -0,0 +1,206 @@
+"""
+Wire format of the multiplayer server.
+
+Every message is a FRAME length followed by its payload, whose first
+byte is the message type. The server sends HELLO once, then SNAPSHOTs
+at a fixed rate; the client sends one input byte per tick (see
+replay.encode_input) with no framing.
+
+A snapshot holds, per entity kind, int16 states (positions in half
+pixels) keyed by sorted entity id. Each is a delta against the previous
+snapshot sent to the same client: ids that left, small differences for
+ids that changed, and full states for ids that are new. Ids are sent as
+gaps between sorted ids, and the whole body is zlib compressed. TCP
+delivers in order, so the client always holds the baseline.
+
+"""
+
+import struct
+import zlib
+import numpy
+
+FRAME = struct.Struct('<I')  # payload length
+HELLO = 1
+SNAPSHOT = 2
+HELLO_BODY = struct.Struct('<BIHHd')  # type, player id, width, height, dt
+SNAPSHOT_HEADER = struct.Struct('<BII')  # type, tick, baseline tick
+BLOCK = struct.Struct('<III')  # removed, updated and added counts
+
+# Entity kinds in snapshot order, with their number of int16 fields
+KINDS = (
+    ('players', 4),  # x, y, teleporter radius, dead
+    ('enemies', 2),  # x, y
+    ('projectiles', 2),  # x, y
+)
+# Positions and sizes are sent in 1/SCALE px
+SCALE = 2.0
+
+ID_TYPE = numpy.dtype('<u4')
+STATE_TYPE = numpy.dtype('<i2')
+
+
+def frame(payload):
+    """Return the [payload] with its length prepended."""
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """Read one framed payload from the asyncio StreamReader [reader]."""
+    length, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(length)
+
+
+def quantize(values):
+    """Return float [values] in px as int16 in 1/SCALE px, clamped."""
+    return numpy.clip(numpy.rint(numpy.multiply(values, SCALE)),
+                      -32768, 32767).astype(STATE_TYPE)
+
+
+def empty_table(fields):
+    """Return the (ids, states) of a kind with no entities."""
+    return (numpy.zeros(0, dtype=numpy.int64),
+            numpy.zeros((0, fields), dtype=STATE_TYPE))
+
+
+def encode_ids(ids):
+    """Return sorted [ids] as bytes of the gaps between them."""
+    gaps = numpy.empty(len(ids), dtype=ID_TYPE)
+    if len(ids):
+        gaps[0] = ids[0]
+        numpy.subtract(ids[1:], ids[:-1], out=gaps[1:], casting='unsafe')
+    return gaps.tobytes()
+
+
+def match(ids, other):
+    """Return (index, found): where sorted [other] holds each of [ids]."""
+    if not len(other):
+        return (numpy.zeros(len(ids), dtype=numpy.int64),
+                numpy.zeros(len(ids), dtype=bool))
+    index = numpy.searchsorted(other, ids)
+    numpy.minimum(index, len(other) - 1, out=index)
+    return index, other[index] == ids
+
+
+def encode_block(table, baseline):
+    """
+    Return the delta of one kind's [table] against its [baseline].
+
+        Parameters:
+            [table]    tuple (ids, states), ids sorted
+            [baseline] tuple (ids, states) the client holds
+
+    """
+    ids, states = table
+    base_ids, base_states = baseline
+    index, known = match(ids, base_ids)
+    removed = base_ids[~match(base_ids, ids)[1]]
+    # int16 differences wrap, and so does adding them back
+    delta = states[known] - base_states[index[known]]
+    changed = delta.any(1)
+    new = ~known
+    return b''.join((
+        BLOCK.pack(len(removed), numpy.count_nonzero(changed),
+                   numpy.count_nonzero(new)),
+        encode_ids(removed),
+        encode_ids(ids[known][changed]),
+        delta[changed].astype(STATE_TYPE).tobytes(),
+        encode_ids(ids[new]),
+        states[new].astype(STATE_TYPE).tobytes(),
+    ))
+
+
+class SnapshotEncoder:
+    """
+    Encodes one client's snapshots as deltas against the last one sent.
+
+        Attributes:
+            [tick]   tick of the last snapshot encoded, 0 for none
+            [tables] dict of kind -> (ids, states) the client holds
+
+    """
+
+    def __init__(self, level=1):
+        """
+        Create new SnapshotEncoder.
+
+            Parameters:
+                [level] (optional) zlib compression level
+
+        """
+        self.level = level
+        self.tick = 0
+        self.tables = {name: empty_table(fields) for name, fields in KINDS}
+
+    def encode(self, tick, tables):
+        """
+        Return the SNAPSHOT payload of [tables], only call it to send one.
+
+            Parameters:
+                [tick]   simulation tick of the snapshot, from 1
+                [tables] dict of kind -> (ids, states), ids sorted
+
+        """
+        body = b''.join(encode_block(tables[name], self.tables[name])
+                        for name, _ in KINDS)
+        payload = SNAPSHOT_HEADER.pack(SNAPSHOT, tick, self.tick) \
+            + zlib.compress(body, self.level)
+        self.tick = tick
+        self.tables = tables
+        return payload
+
+
+class SnapshotDecoder:
+    """
+    Rebuilds the entity tables from a client's stream of snapshots.
+
+        Attributes:
+            [tick]   tick of the last snapshot applied, 0 for none
+            [tables] dict of kind -> (ids, states), ids sorted
+
+    """
+
+    def __init__(self):
+        """Create new SnapshotDecoder holding no entities."""
+        self.tick = 0
+        self.tables = {name: empty_table(fields) for name, fields in KINDS}
+
+    def apply(self, payload):
+        """Apply the SNAPSHOT [payload], return its tick."""
+        kind, tick, baseline = SNAPSHOT_HEADER.unpack_from(payload)
+        if kind != SNAPSHOT or baseline != self.tick:
+            raise ValueError('snapshot against tick {}, holding {}'.format(
+                baseline, self.tick))
+        body = zlib.decompress(payload[SNAPSHOT_HEADER.size:])
+        offset = 0
+        for name, fields in KINDS:
+            removed, updated, added = BLOCK.unpack_from(body, offset)
+            offset += BLOCK.size
+            removed_ids, offset = self.read_ids(body, offset, removed)
+            updated_ids, offset = self.read_ids(body, offset, updated)
+            deltas, offset = self.read_states(body, offset, updated, fields)
+            added_ids, offset = self.read_ids(body, offset, added)
+            states, offset = self.read_states(body, offset, added, fields)
+            ids, old_states = self.tables[name]
+            keep = ~match(ids, removed_ids)[1]
+            ids, old_states = ids[keep], old_states[keep]
+            old_states[numpy.searchsorted(ids, updated_ids)] += deltas
+            ids = numpy.concatenate((ids, added_ids))
+            states = numpy.concatenate((old_states, states))
+            order = numpy.argsort(ids, kind='stable')
+            self.tables[name] = (ids[order], states[order])
+        self.tick = tick
+        return tick
+
+    @staticmethod
+    def read_ids(body, offset, count):
+        """Return ([count] ids read at [offset], the offset after them)."""
+        gaps = numpy.frombuffer(body, ID_TYPE, count, offset)
+        return (numpy.cumsum(gaps, dtype=numpy.int64),
+                offset + count * ID_TYPE.itemsize)
+
+    @staticmethod
+    def read_states(body, offset, count, fields):
+        """Return ([count] states read at [offset], the offset after them)."""
+        states = numpy.frombuffer(body, STATE_TYPE, count * fields, offset)
+        return (states.reshape(count, fields).astype(STATE_TYPE),
+                offset + count * fields * STATE_TYPE.itemsize)
@@ -0,0 +1,235 @@
+"""Deterministic input recording and headless replay."""
+
+import hashlib
+import struct
+import time
+import numpy
+import controller
+
+# File layout: HEADER, one input byte per tick, then FOOTER once closed
+MAGIC = b'TPRC'
+# Bumped whenever a change to the simulation changes how inputs play out
+VERSION = 6
+HEADER = struct.Struct('<4sBqdHH')  # magic, version, seed, dt, width, height
+FOOTER_MAGIC = b'TEND'
+FOOTER = struct.Struct('<4sI32s')  # magic, ticks, state hash
+
+# Input byte bits
+MOVE_X_NEGATIVE = 0x01
+MOVE_X_POSITIVE = 0x02
+MOVE_Y_NEGATIVE = 0x04
+MOVE_Y_POSITIVE = 0x08
+HOLD = 0x10
+RESTART = 0x20
+
+
+def encode_input(input_source):
+    """Pack an input source's current state into one byte."""
+    x, y = input_source.move_vec
+    byte = 0
+    if x < 0:
+        byte |= MOVE_X_NEGATIVE
+    elif x > 0:
+        byte |= MOVE_X_POSITIVE
+    if y < 0:
+        byte |= MOVE_Y_NEGATIVE
+    elif y > 0:
+        byte |= MOVE_Y_POSITIVE
+    if input_source.hold:
+        byte |= HOLD
+    if input_source.restart:
+        byte |= RESTART
+    return byte
+
+
+def decode_input(byte):
+    """Return (move_vec, hold, restart) packed in the [byte]."""
+    move_vec = [0, 0]
+    if byte & MOVE_X_NEGATIVE:
+        move_vec[0] = -1
+    elif byte & MOVE_X_POSITIVE:
+        move_vec[0] = 1
+    if byte & MOVE_Y_NEGATIVE:
+        move_vec[1] = -1
+    elif byte & MOVE_Y_POSITIVE:
+        move_vec[1] = 1
+    return move_vec, bool(byte & HOLD), bool(byte & RESTART)
+
+
+def state_hash(simulation):
+    """Return a SHA-256 digest of the [simulation]'s game state."""
+    digest = hashlib.sha256()
+    player = simulation.player_controller.player
+    enemy_controller = simulation.enemy_controller
+    enemy_controller.sync_rects()
+    projectiles = enemy_controller.projectiles
+    n = projectiles.count
+    digest.update(repr((
+        simulation.tick,
+        simulation.game_over,
+        tuple(player.rect),
+        tuple(player.teleporter.rect),
+        enemy_controller.spawn_timer,
+        enemy_controller.spawn_cooldown,
+        [(tuple(enemy.rect), enemy.timer, enemy.archetype.name)
+         for enemy in enemy_controller.enemies],
+    )).encode())
+    digest.update(numpy.array([enemy.health
+                               for enemy in enemy_controller.enemies],
+                              dtype=float).tobytes())
+    trail = simulation.player_controller.trail
+    rows = trail.rows()
+    digest.update(trail.center[rows].tobytes())
+    digest.update(trail.size[rows].tobytes())
+    digest.update((trail.clock.now - trail.created_at[rows]).tobytes())
+    digest.update(projectiles.position[:n].tobytes())
+    digest.update(projectiles.velocity[:n].tobytes())
+    return digest.digest()
+
+
+class InputRecorder:
+    """Streams one input byte per tick to a recording file."""
+
+    def __init__(self, path, seed, dt, size, buffer_size=4096):
+        """
+        Create new InputRecorder and write the header.
+
+            Parameters:
+                [path]        file to record to
+                [seed]        seed of the recorded simulation
+                [dt]          fixed time step in ms
+                [size]        tuple (width, height) of the arena
+                [buffer_size] (optional) ticks buffered between writes
+
+        """
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, dt, *size))
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.ticks = 0
+
+    def record(self, input_source):
+        """Record the [input_source]'s state for one tick."""
+        self.buffer.append(encode_input(input_source))
+        self.ticks += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered ticks to disk."""
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self, simulation):
+        """Write the footer with the final state of the [simulation]."""
+        self.flush()
+        self.file.write(FOOTER.pack(FOOTER_MAGIC, self.ticks,
+                                    state_hash(simulation)))
+        self.file.close()
+
+
+class RecordingInputController:
+    """Input source that records every poll of the one it wraps."""
+
+    def __init__(self, input_source, recorder):
+        """
+        Create recording input controller.
+
+            Parameters:
+                [input_source] input source to poll and record
+                [recorder]     InputRecorder to write to
+
+        """
+        self.input_source = input_source
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        """Read input state from the wrapped input source."""
+        return getattr(self.input_source, name)
+
+    def poll(self):
+        """Poll the wrapped input source and record its state."""
+        self.input_source.poll()
+        self.recorder.record(self.input_source)
+
+
+class ReplayInputController(controller.IdleInputController):
+    """Input source that plays back recorded input bytes."""
+
+    def __init__(self, inputs):
+        """
+        Create replay input controller.
+
+            Parameters:
+                [inputs] bytes, one recorded input byte per tick
+
+        """
+        self.inputs = inputs
+        self.position = 0
+        controller.IdleInputController.__init__(self)
+
+    def poll(self):
+        """Play back the next tick's input."""
+        self.move_vec, self.hold, self.restart = \
+            decode_input(self.inputs[self.position])
+        self.position += 1
+
+
+class Recording:
+    """
+    A loaded input recording.
+
+        Attributes:
+            [seed]       seed of the recorded simulation
+            [dt]         fixed time step in ms
+            [size]       tuple (width, height) of the arena
+            [inputs]     bytes, one input byte per tick
+            [state_hash] final state digest, None if never closed
+
+    """
+
+    def __init__(self, path):
+        """Load the recording at [path]."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, self.dt, width, height = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} recording'.format(
+                path, VERSION))
+        self.size = (width, height)
+        body = data[HEADER.size:]
+        self.state_hash = None
+        if len(body) >= FOOTER.size:
+            magic, ticks, digest = FOOTER.unpack_from(body,
+                                                      len(body) - FOOTER.size)
+            if magic == FOOTER_MAGIC and ticks == len(body) - FOOTER.size:
+                body = body[:ticks]
+                self.state_hash = digest
+        self.inputs = body
+
+
+def replay(path):
+    """
+    Re-run the recording at [path] headless, as fast as possible.
+
+    Returns (matches, ticks, elapsed): whether the final state hash
+    matches the recorded one (None if the recording was never closed),
+    the number of ticks replayed and the time taken in seconds.
+
+    """
+    recording = Recording(path)
+    input_source = ReplayInputController(recording.inputs)
+    simulation = controller.SimulationController(
+        recording.size, input_source, recording.dt, seed=recording.seed
+    )
+    start = time.perf_counter()
+    for _ in range(len(recording.inputs)):
+        simulation.step()
+        if simulation.game_over and input_source.restart:
+            simulation.reset()
+    elapsed = time.perf_counter() - start
+    matches = None
+    if recording.state_hash is not None:
+        matches = state_hash(simulation) == recording.state_hash
+    return matches, len(recording.inputs), elapsed
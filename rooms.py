@@ -0,0 +1,406 @@
+"""
+Many independent arenas sharded across worker processes.
+
+    python rooms.py --workers 4 --rooms 32 --health-port 8080
+
+Each worker steps its rooms at the simulation rate. The supervisor reads
+every room's measured tick time, places new rooms on the least loaded
+worker and migrates rooms off workers whose rooms together take more
+than [budget] of a tick. GET /health on the health port returns the
+latest per-worker and per-room tick times as JSON.
+
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import multiprocessing
+import pickle
+import random
+import time
+import controller
+import replay
+import server
+import settings
+import snapshot
+import util.cli
+
+
+class Room:
+    """
+    An ArenaSimulation played by bots, stepped by a worker.
+
+        Attributes:
+            [room_id]    unique id of the room
+            [arena]      ArenaSimulation being played
+            [bots]       dict of player id -> RandomInputController
+            [tick_times] deque of the latest tick times in s
+
+    """
+
+    def __init__(self, room_id, players=4, size=settings.WORLD_SIZE,
+                 seed=None, window=120):
+        """
+        Create new Room.
+
+            Parameters:
+                [room_id] unique id of the room
+                [players] (optional) number of bot players
+                [size]    (optional) tuple (width, height) of the arena
+                [seed]    (optional) seed of the arena and the bots
+                [window]  (optional) ticks kept in [tick_times]
+
+        """
+        self.room_id = room_id
+        self.arena = server.ArenaSimulation(size, seed=seed)
+        self.bots = {}
+        for i in range(players):
+            bot_seed = None if seed is None else seed * 1000 + i
+            self.bots[self.arena.add_player()] = \
+                controller.RandomInputController(bot_seed)
+        self.tick_times = collections.deque(maxlen=window)
+
+    def __getstate__(self):
+        """Pickle the arena as a snapshot, the rest as it is."""
+        state = self.__dict__.copy()
+        state['arena'] = snapshot.dumps(self.arena)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the arena from its snapshot."""
+        state['arena'] = snapshot.loads(state['arena'])
+        self.__dict__.update(state)
+
+    def step(self):
+        """Poll the bots and advance the arena by one tick, timing it."""
+        start = time.perf_counter()
+        inputs = {}
+        for player_id, bot in self.bots.items():
+            bot.poll()
+            inputs[player_id] = replay.encode_input(bot)
+        self.arena.step(inputs)
+        self.tick_times.append(time.perf_counter() - start)
+
+    def stats(self):
+        """Return a dict of the room's size and tick times in ms."""
+        times = sorted(self.tick_times) or [0.0]
+        return {
+            'players': len(self.arena.players),
+            'enemies': len(self.arena.enemy_controller.enemies),
+            'projectiles': len(self.arena.enemy_controller.projectiles),
+            'tick_ms': sum(times) / len(times) * 1000.0,
+            'p99_ms': times[int(0.99 * (len(times) - 1))] * 1000.0,
+            'max_ms': times[-1] * 1000.0,
+        }
+
+
+def run_worker(index, connection, dt):
+    """
+    Step the rooms the supervisor hands over, until told to stop.
+
+    Commands arrive on the Pipe [connection] between ticks, as tuples
+    ('add', snapshot), ('remove', room id), ('stats',) or ('stop',); each
+    gets one reply.
+
+        Parameters:
+            [index]      index of this worker
+            [connection] worker end of a Pipe to the supervisor
+            [dt]         tick time in s
+
+    """
+    rooms = {}
+    late = 0
+    ticks = 0
+    busy = 0.0
+    next_tick = time.perf_counter()
+    while True:
+        start = time.perf_counter()
+        for room in rooms.values():
+            room.step()
+        busy += time.perf_counter() - start
+        ticks += 1
+        next_tick += dt
+        # Serve commands while waiting for the next tick
+        while True:
+            delay = next_tick - time.perf_counter()
+            if delay <= 0:
+                # Missed the deadline, don't try to catch up
+                late += 1
+                next_tick = time.perf_counter()
+                break
+            if not connection.poll(delay):
+                break
+            command = connection.recv()
+            if command[0] == 'add':
+                room = load_room(command[1])
+                rooms[room.room_id] = room
+                connection.send(None)
+            elif command[0] == 'remove':
+                connection.send(save_room(rooms.pop(command[1])))
+            elif command[0] == 'stats':
+                connection.send({
+                    'late': late,
+                    'busy': busy / max(ticks * dt, 1e-9),
+                    'rooms': {room_id: room.stats()
+                              for room_id, room in rooms.items()},
+                })
+                late = ticks = 0
+                busy = 0.0
+            elif command[0] == 'stop':
+                connection.send(None)
+                return
+
+
+def save_room(room):
+    """Return the [room] as bytes, its arena as a snapshot, to move it."""
+    return pickle.dumps(room, pickle.HIGHEST_PROTOCOL)
+
+
+def load_room(snapshot):
+    """Return the Room saved in [snapshot]."""
+    return pickle.loads(snapshot)
+
+
+class Worker:
+    """
+    Supervisor's handle on one worker process.
+
+        Attributes:
+            [index]   index of the worker
+            [process] multiprocessing.Process stepping the rooms
+            [rooms]   set of the ids of the rooms it steps
+            [stats]   latest reply to 'stats', see run_worker()
+            [load]    estimated ms per tick of its rooms
+
+    """
+
+    def __init__(self, index, dt):
+        """
+        Start new Worker.
+
+            Parameters:
+                [index] index of the worker
+                [dt]    tick time in s
+
+        """
+        self.index = index
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_worker, args=(index, child, dt), daemon=True,
+            name='rooms-{}'.format(index))
+        self.process.start()
+        self.rooms = set()
+        self.stats = {'late': 0, 'busy': 0.0, 'rooms': {}}
+        self.load = 0.0
+
+    def request(self, *command):
+        """Send the [command] and return the reply, within about a tick."""
+        self.connection.send(command)
+        return self.connection.recv()
+
+    def room_load(self, room_id):
+        """Return the last measured ms per tick of the room [room_id]."""
+        return self.stats['rooms'].get(room_id, {}).get('tick_ms', 0.0)
+
+
+class Supervisor:
+    """
+    Places rooms on workers by measured tick time and rebalances them.
+
+        Attributes:
+            [workers]    list of Workers
+            [budget]     fraction of a tick the rooms of one worker may
+                         take before rooms are moved off it
+            [migrations] number of rooms moved so far
+            [last_move]  ms the last move took, snapshot to restart
+
+    """
+
+    def __init__(self, worker_count, dt=1.0/settings.SIMULATION_RATE,
+                 budget=0.75):
+        """
+        Start the workers.
+
+            Parameters:
+                [worker_count] number of worker processes
+                [dt]           (optional) tick time in s
+                [budget]       (optional) fraction of a tick per worker
+
+        """
+        self.dt = dt
+        self.budget = budget
+        self.workers = [Worker(i, dt) for i in range(worker_count)]
+        self.room_ids = itertools.count(1)
+        self.migrations = 0
+        self.last_move = 0.0
+
+    def estimate(self):
+        """Return the mean measured ms per tick of a room, to place one."""
+        loads = [room['tick_ms'] for worker in self.workers
+                 for room in worker.stats['rooms'].values()]
+        return sum(loads) / len(loads) if loads else 0.0
+
+    def add_room(self, players=4, size=settings.WORLD_SIZE, seed=None):
+        """Create a room on the least loaded worker, return its id."""
+        room = Room(next(self.room_ids), players, size, seed)
+        # Fewest rooms breaks ties, e.g. before anything is measured
+        worker = min(self.workers,
+                     key=lambda worker: (worker.load, len(worker.rooms)))
+        worker.request('add', save_room(room))
+        worker.rooms.add(room.room_id)
+        # Until it is measured, count it as an average room
+        worker.load += self.estimate()
+        return room.room_id
+
+    def poll(self):
+        """Collect every worker's tick times and update its load."""
+        for worker in self.workers:
+            worker.stats = worker.request('stats')
+            worker.load = sum(room['tick_ms']
+                              for room in worker.stats['rooms'].values())
+
+    def move(self, room_id, source, target):
+        """Move the room [room_id] from worker [source] to [target]."""
+        start = time.perf_counter()
+        snapshot = source.request('remove', room_id)
+        target.request('add', snapshot)
+        self.last_move = (time.perf_counter() - start) * 1000.0
+        source.rooms.discard(room_id)
+        target.rooms.add(room_id)
+        load = source.room_load(room_id)
+        source.load -= load
+        target.load += load
+        self.migrations += 1
+
+    def rebalance(self):
+        """
+        Move one room off the most loaded worker if it is over [budget].
+
+        The room moved is the most expensive one that still leaves the
+        least loaded worker below the most loaded one, so moves always
+        narrow the gap and never ping-pong.
+
+        """
+        hot = max(self.workers, key=lambda worker: worker.load)
+        cold = min(self.workers, key=lambda worker: worker.load)
+        if hot.load <= self.budget * self.dt * 1000.0 or hot is cold:
+            return None
+        gap = hot.load - cold.load
+        movable = [room_id for room_id in hot.rooms
+                   if 0 < hot.room_load(room_id) < gap / 2.0]
+        if not movable:
+            return None
+        room_id = max(movable, key=hot.room_load)
+        self.move(room_id, hot, cold)
+        return room_id
+
+    def health(self):
+        """Return the latest tick times of every worker and room."""
+        return {
+            'tick_ms': self.dt * 1000.0,
+            'budget_ms': self.budget * self.dt * 1000.0,
+            'migrations': self.migrations,
+            'last_move_ms': self.last_move,
+            'workers': [{
+                'index': worker.index,
+                'pid': worker.process.pid,
+                'load_ms': worker.load,
+                'busy': worker.stats['busy'],
+                'late_ticks': worker.stats['late'],
+                'rooms': worker.stats['rooms'],
+            } for worker in self.workers],
+        }
+
+    def stop(self):
+        """Stop every worker."""
+        for worker in self.workers:
+            worker.request('stop')
+            worker.process.join()
+
+    async def serve_health(self, reader, writer):
+        """Answer one HTTP request: GET /health returns health() as JSON."""
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # Headers
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] == b'GET' and parts[1] == b'/health':
+            status, body = '200 OK', json.dumps(self.health()).encode()
+        else:
+            status, body = '404 Not Found', b'{}'
+        writer.write('HTTP/1.0 {}\r\nContent-Type: application/json\r\n'
+                     'Content-Length: {}\r\n\r\n'.format(
+                         status, len(body)).encode() + body)
+        await writer.drain()
+        writer.close()
+
+    async def run(self, host, port, duration=None, interval=1.0):
+        """
+        Serve /health and rebalance every [interval] s for [duration] s.
+
+        """
+        health = await asyncio.start_server(self.serve_health, host, port)
+        print('health on http://{}:{}/health'.format(host, port),
+              flush=True)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async with health:
+            while duration is None or loop.time() - start < duration:
+                await asyncio.sleep(interval)
+                # Each request waits on a worker for up to a tick, so
+                # they run on a thread and /health answers meanwhile
+                await loop.run_in_executor(None, self.poll)
+                moved = await loop.run_in_executor(None, self.rebalance)
+                self.report(moved)
+
+    def report(self, moved=None):
+        """Print one line of every worker's load."""
+        print(' | '.join(
+            'worker {}: {} rooms {:.2f} ms {:.0%} busy {} late'.format(
+                worker.index, len(worker.rooms), worker.load,
+                worker.stats['busy'], worker.stats['late'])
+            for worker in self.workers)
+            + (' | moved room {} in {:.1f} ms'.format(moved, self.last_move)
+               if moved is not None else ''), flush=True)
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Run many arena rooms across worker processes.')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='worker processes, one per core by default')
+    parser.add_argument('--rooms', type=int, default=8,
+                        help='rooms to create')
+    parser.add_argument('--players', type=int, default=8,
+                        help='most bot players in a room, each room gets '
+                             'between 1 and this many')
+    parser.add_argument('--world-size', type=util.cli.world_size,
+                        default=settings.WORLD_SIZE, metavar='WxH',
+                        help='arena size of every room')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the room sizes and the rooms')
+    parser.add_argument('--budget', type=float, default=0.75,
+                        help='fraction of a tick one worker may spend')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--health-port', type=int, default=8080)
+    parser.add_argument('--duration', type=float, default=None,
+                        help='seconds to run, forever by default')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rng = random.Random(args.seed)
+    supervisor = Supervisor(args.workers, budget=args.budget)
+    for i in range(args.rooms):
+        seed = None if args.seed is None else args.seed + i
+        supervisor.add_room(rng.randint(1, args.players), args.world_size,
+                            seed)
+    try:
+        asyncio.run(supervisor.run(args.host, args.health_port,
+                                   args.duration))
+    finally:
+        supervisor.stop()
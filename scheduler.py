@@ -0,0 +1,145 @@
+"""Frame pacing for the gameplay loop and timed simulation events."""
+
+import heapq
+import itertools
+import time
+
+
+class FrameScheduler:
+    """
+    Fixed-rate simulation scheduler with a capped render rate.
+
+    Real elapsed time is added to an accumulator that is spent in fixed
+    simulation steps; whatever is left over becomes the interpolation
+    factor for drawing between the last two simulation states.
+
+        Attributes:
+            [step_time]      simulation time step in ms
+            [frame_time]     minimum time between frames in ms
+            [max_frame_time] most real time in ms simulated per frame
+            [accumulator]    real time in ms not yet simulated
+
+    """
+
+    def __init__(self, simulation_rate, render_rate, max_frame_time=250,
+                 clock=time.perf_counter, sleep=time.sleep):
+        """
+        Create new FrameScheduler.
+
+            Parameters:
+                [simulation_rate] simulation ticks per second
+                [render_rate]     maximum frames drawn per second
+                [max_frame_time]  (optional) clamp on simulated time per
+                                  frame in ms
+                [clock]           (optional) clock in seconds
+                [sleep]           (optional) sleep function in seconds
+
+        """
+        self.step_time = 1000.0 / simulation_rate
+        self.frame_time = 1000.0 / render_rate
+        self.max_frame_time = max_frame_time
+        self.clock = clock
+        self.sleep = sleep
+        self.reset()
+
+    def reset(self):
+        """Forget accumulated time, e.g. after a restart."""
+        self.accumulator = 0.0
+        self.prev_time = self.clock()
+        self.next_frame = self.prev_time
+
+    def advance(self):
+        """Return (steps, alpha): ticks to simulate and the leftover blend."""
+        time_now = self.clock()
+        elapsed = (time_now - self.prev_time) * 1000.0
+        self.prev_time = time_now
+        self.accumulator += min(elapsed, self.max_frame_time)
+        steps = int(self.accumulator // self.step_time)
+        self.accumulator -= steps * self.step_time
+        return steps, self.accumulator / self.step_time
+
+    def wait(self):
+        """Sleep until the next frame is due."""
+        self.next_frame += self.frame_time / 1000.0
+        delay = self.next_frame - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+        else:
+            # Running behind, don't try to catch up on missed frames
+            self.next_frame = self.clock()
+
+
+class TimerQueue:
+    """
+    Simulation clock with a min-heap of events run once they are due.
+
+    Entities keep the time their cooldown started instead of a counter,
+    so advancing the clock only touches events that expire, not every
+    entity that is waiting.
+
+        Attributes:
+            [now]    current simulation time in ms
+            [events] heap of [due, sequence, callback, args] lists
+
+    """
+
+    def __init__(self):
+        """Create new, empty TimerQueue."""
+        self.sequence = itertools.count()
+        self.clear()
+
+    def __len__(self):
+        """Return the number of pending events, cancelled ones included."""
+        return len(self.events)
+
+    def clear(self):
+        """Drop every event and rewind the clock to 0."""
+        self.now = 0
+        self.events = []
+
+    def schedule(self, due, callback, *args):
+        """
+        Call [callback] with [args] once the clock passes [due].
+
+        Events due at the same time run in the order they were scheduled.
+        Returns the event, for cancel().
+
+            Parameters:
+                [due]      time in ms
+                [callback] function to call
+                [args]     (optional) arguments to call it with
+
+        """
+        event = [due, next(self.sequence), callback, args]
+        heapq.heappush(self.events, event)
+        return event
+
+    def extend(self, events):
+        """
+        Schedule many events at once, in the order given.
+
+        Same as calling schedule() for each, but builds the heap once.
+        Returns the list of events, for cancel().
+
+            Parameters:
+                [events] iterable of (due, callback, args) tuples
+
+        """
+        added = [[due, next(self.sequence), callback, tuple(args)]
+                 for due, callback, args in events]
+        self.events.extend(added)
+        heapq.heapify(self.events)
+        return added
+
+    def cancel(self, event):
+        """Stop the [event] from running, it is dropped once due."""
+        event[2] = None
+
+    def advance(self, dt):
+        """Move the clock forward by [dt] and run the events passed."""
+        self.now += dt
+        events = self.events
+        while events and events[0][0] < self.now:
+            _, _, callback, args = heapq.heappop(events)
+            if callback is not None:
+                callback(*args)
@@ -0,0 +1,431 @@
+"""
+Authoritative multiplayer server for a shared arena.
+
+    python server.py --port 7777 --world-size 4000x3000
+
+Clients connect over TCP, send one input byte per tick and receive delta
+snapshots of what is near their player, see protocol.py. Every report
+interval the server prints the tick time and the bandwidth per player;
+loadtest.py connects hundreds of bots to measure them.
+
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import time
+import numpy
+import controller
+import protocol
+import replay
+import settings
+import util.cli
+import util.rect
+
+
+class ArenaSimulation:
+    """
+    Headless arena shared by any number of players.
+
+    Like SimulationController, but with a PlayerController per player.
+    Enemies shoot at the nearest live player. Each spawn is a wave of one
+    enemy per live player, kept clear of the next live player in turn,
+    until there are [enemies_per_player] enemies per live player. Players
+    join and restart at a spot the enemy spawn planner picks clear of the
+    enemies and the other players' teleport range. A hit player stays
+    dead until its input asks to restart; with nobody alive the arena
+    waits.
+
+        Attributes:
+            [size]               tuple (width, height) of the arena
+            [dt]                 fixed time step in ms
+            [enemies_per_player] most enemies per live player
+            [players]            dict of player id -> PlayerController
+            [dead]               set of ids of the players that were hit
+            [kills]              dict of player id -> enemies destroyed
+            [tick]               number of ticks simulated
+
+    """
+
+    def __init__(self, size=settings.WORLD_SIZE,
+                 dt=1000.0/settings.SIMULATION_RATE, seed=None,
+                 enemies_per_player=2.0):
+        """
+        Create new, empty ArenaSimulation.
+
+            Parameters:
+                [size]               (optional) tuple (width, height) of
+                                     the arena
+                [dt]                 (optional) fixed time step in ms
+                [seed]               (optional) seed for the enemies' RNG
+                [enemies_per_player] (optional) most enemies per live
+                                     player
+
+        """
+        self.size = size
+        self.dt = dt
+        self.enemies_per_player = enemies_per_player
+        self.enemy_controller = controller.EnemyController(size, seed)
+        # Every player shares one grid rebuild per tick
+        self.collision_controller = controller.CollisionController(
+            size, spatial_hash=True)
+        self.enemy_controller.reset()
+        self.ids = itertools.count(1)
+        self.players = {}
+        self.dead = set()
+        self.kills = {}
+        self.tick = 0
+
+    def add_player(self):
+        """Add a player and return its id, see place()."""
+        player_id = next(self.ids)
+        player_controller = controller.PlayerController(self.size)
+        self.place(player_controller)
+        self.players[player_id] = player_controller
+        self.kills[player_id] = 0
+        return player_id
+
+    def place(self, player_controller):
+        """Reset the player of [player_controller] at a clear spot."""
+        enemy_controller = self.enemy_controller
+        padding = enemy_controller.player_padding
+        others = [self.players[player_id].player
+                  for player_id in self.players
+                  if player_id not in self.dead
+                  and self.players[player_id] is not player_controller]
+        reach = numpy.array(
+            [player.rect.center + (player.teleporter.rect.width + padding,
+                                   player.teleporter.rect.height + padding)
+             for player in others], dtype=float).reshape(-1, 4)
+        enemy_centers, enemy_half_sizes = enemy_controller.geometry()
+        occupied = (numpy.concatenate([reach[:, :2], enemy_centers]),
+                    numpy.concatenate([reach[:, 2:] / 2.0,
+                                       enemy_half_sizes]))
+        player_controller.player_start_center, = \
+            enemy_controller.spawn_planner.plan(
+                1, None, player_controller.player_size, occupied)
+        player_controller.reset_player()
+
+    def remove_player(self, player_id):
+        """Remove the player [player_id]."""
+        del self.players[player_id]
+        del self.kills[player_id]
+        self.dead.discard(player_id)
+
+    def step(self, inputs):
+        """
+        Advance the arena by one tick.
+
+            Parameters:
+                [inputs] dict of player id -> input byte for this tick, see
+                         replay.encode_input; missing players stay idle
+
+        """
+        dt = self.dt
+        live = []
+        for player_id, player_controller in self.players.items():
+            move_vec, hold, restart = replay.decode_input(
+                inputs.get(player_id, 0))
+            if player_id in self.dead:
+                if not restart:
+                    continue
+                self.dead.discard(player_id)
+                self.place(player_controller)
+            player_controller.update(dt, move_vec, hold)
+            live.append(player_id)
+        if not live:
+            return
+        self.tick += 1
+        # Update enemies
+        enemy_controller = self.enemy_controller
+        players = [self.players[player_id].player for player_id in live]
+        enemy_controller.targets = players
+        enemy_controller.wave_size = min(
+            len(live), int(self.enemies_per_player * len(live))
+            - len(enemy_controller.enemies))
+        enemy_controller.update(dt, players[self.tick % len(players)])
+        # Enemy collisions FIRST (destroy enemies), then player collisions
+        collision_controller = self.collision_controller
+        inside = collision_controller.update_enemies(
+            players, enemy_controller.enemies, enemy_controller.geometry())
+        destroyed = set()
+        for player_id, enemies in zip(live, inside):
+            if enemies:
+                killed = enemy_controller.hit(
+                    [enemy for enemy in enemies if enemy not in destroyed],
+                    dt)
+                destroyed.update(killed)
+                self.kills[player_id] += len(killed)
+        hits = collision_controller.update_players(
+            players, enemy_controller.projectiles)
+        for player_id, player_hits in zip(live, hits):
+            if player_hits:
+                self.dead.add(player_id)
+
+    def world_state(self):
+        """
+        Return dict of kind -> (ids, centers, states) of every entity.
+
+        Ids are sorted, centers are float px and states are quantized
+        for protocol.py. Built once per snapshot round and shared by
+        every client's visible().
+
+        """
+        players = self.players
+        ids = numpy.fromiter(players, dtype=numpy.int64, count=len(players))
+        values = numpy.array(
+            [player_controller.player.rect.center
+             + (player_controller.player.teleporter.rect.width / 2.0,)
+             for player_controller in players.values()], dtype=float
+        ).reshape(-1, 3)
+        player_states = numpy.column_stack((
+            protocol.quantize(values),
+            numpy.isin(ids, list(self.dead)).astype(protocol.STATE_TYPE)))
+        enemy_controller = self.enemy_controller
+        enemies = enemy_controller.enemies
+        # Enemies and projectiles are appended with increasing ids
+        enemy_ids = numpy.fromiter((enemy.id for enemy in enemies),
+                                   dtype=numpy.int64, count=len(enemies))
+        enemy_centers = enemy_controller.geometry()[0]
+        projectiles = enemy_controller.projectiles
+        n = projectiles.count
+        return {
+            'players': (ids, values[:, :2], player_states),
+            'enemies': (enemy_ids, enemy_centers,
+                        protocol.quantize(enemy_centers)),
+            'projectiles': (projectiles.id[:n].copy(),
+                            projectiles.position[:n].copy(),
+                            protocol.quantize(projectiles.position[:n])),
+        }
+
+    @staticmethod
+    def visible(state, rect):
+        """Return dict of kind -> (ids, states) centered in the [rect]."""
+        tables = {}
+        half_size = (rect.width / 2.0, rect.height / 2.0)
+        for name, (ids, centers, states) in state.items():
+            inside = (numpy.abs(centers - rect.center) < half_size).all(1)
+            tables[name] = (ids[inside], states[inside])
+        return tables
+
+
+class Connection:
+    """
+    A connected client and the snapshots it was sent.
+
+        Attributes:
+            [player_id] id of the client's player in the arena
+            [writer]    asyncio StreamWriter to the client
+            [inputs]    deque of input bytes not yet simulated
+            [encoder]   SnapshotEncoder holding the client's baseline
+            [sent]      bytes sent since the last report
+
+    """
+
+    def __init__(self, player_id, writer, max_inputs=8):
+        """
+        Create new Connection.
+
+            Parameters:
+                [player_id]  id of the client's player
+                [writer]     asyncio StreamWriter to the client
+                [max_inputs] (optional) inputs queued before the oldest
+                             are dropped, bounding input latency
+
+        """
+        self.player_id = player_id
+        self.writer = writer
+        self.inputs = collections.deque(maxlen=max_inputs)
+        self.last_input = 0
+        self.encoder = protocol.SnapshotEncoder()
+        self.sent = 0
+
+    def next_input(self):
+        """Return this tick's input: the oldest queued, else keep holding."""
+        if self.inputs:
+            self.last_input = self.inputs.popleft()
+            return self.last_input
+        return self.last_input & replay.HOLD
+
+    def send(self, payload):
+        """Frame and queue the [payload] for writing."""
+        data = protocol.frame(payload)
+        self.writer.write(data)
+        self.sent += len(data)
+
+
+class GameServer:
+    """
+    Runs an ArenaSimulation at a fixed rate for TCP clients.
+
+    Each client is a player. Every [snapshot_interval] ticks it is sent
+    the entities within [view_size] of its player, as a delta against
+    what it was sent last. A client whose socket buffer holds more than
+    [max_buffer] bytes is skipped until it catches up, so a slow reader
+    can't make the server queue snapshots without bound.
+
+        Attributes:
+            [arena]       ArenaSimulation being played
+            [connections] dict of player id -> Connection
+
+    """
+
+    def __init__(self, arena, snapshot_rate=20, view_size=None,
+                 max_buffer=65536, report_interval=1.0):
+        """
+        Create new GameServer.
+
+            Parameters:
+                [arena]           ArenaSimulation to run
+                [snapshot_rate]   (optional) snapshots per second
+                [view_size]       (optional) tuple (width, height) of the
+                                  area sent to each client, by default a
+                                  quarter more than the screen
+                [max_buffer]      (optional) unsent bytes to skip a client
+                [report_interval] (optional) seconds between reports
+
+        """
+        self.arena = arena
+        self.snapshot_interval = max(1, int(round(
+            1000.0 / arena.dt / snapshot_rate)))
+        self.view_size = view_size or (settings.SCREEN_SIZE[0] * 1.25,
+                                       settings.SCREEN_SIZE[1] * 1.25)
+        self.max_buffer = max_buffer
+        self.report_interval = report_interval
+        self.connections = {}
+        self.ticks = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start a new report interval."""
+        self.stats = collections.Counter()
+        self.max_tick_time = 0.0
+
+    async def serve(self, host, port, duration=None):
+        """Accept clients on [host]:[port] and tick until [duration] s."""
+        server = await asyncio.start_server(self.handle, host, port)
+        print('listening on {}:{}'.format(host, port), flush=True)
+        async with server:
+            await self.run(duration)
+
+    async def handle(self, reader, writer):
+        """Play one client's player until it disconnects."""
+        arena = self.arena
+        player_id = arena.add_player()
+        connection = Connection(player_id, writer)
+        self.connections[player_id] = connection
+        connection.send(protocol.HELLO_BODY.pack(
+            protocol.HELLO, player_id, arena.size[0], arena.size[1],
+            arena.dt))
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    break
+                connection.inputs.extend(data)
+        except ConnectionError:
+            pass
+        finally:
+            del self.connections[player_id]
+            arena.remove_player(player_id)
+            writer.close()
+
+    async def run(self, duration=None):
+        """Tick at the arena's rate, for [duration] s or forever."""
+        loop = asyncio.get_running_loop()
+        dt = self.arena.dt / 1000.0
+        start = next_tick = next_report = loop.time()
+        while duration is None or loop.time() - start < duration:
+            self.tick()
+            if loop.time() >= next_report:
+                self.report(loop.time() - next_report + self.report_interval)
+                next_report = loop.time() + self.report_interval
+            next_tick += dt
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Running behind, don't try to catch up on missed ticks
+                next_tick = loop.time()
+                self.stats['late'] += 1
+            await asyncio.sleep(max(delay, 0))
+
+    def tick(self):
+        """Simulate one tick, then send snapshots if they are due."""
+        start = time.perf_counter()
+        inputs = {player_id: connection.next_input()
+                  for player_id, connection in self.connections.items()}
+        self.arena.step(inputs)
+        simulated = time.perf_counter()
+        self.ticks += 1
+        if self.ticks % self.snapshot_interval == 0:
+            self.send_snapshots()
+        end = time.perf_counter()
+        self.stats['ticks'] += 1
+        self.stats['simulation'] += simulated - start
+        self.stats['snapshots'] += end - simulated
+        self.max_tick_time = max(self.max_tick_time, end - start)
+
+    def send_snapshots(self):
+        """Send every client a delta snapshot of what is near its player."""
+        arena = self.arena
+        state = arena.world_state()
+        for player_id, connection in self.connections.items():
+            transport = connection.writer.transport
+            if transport.get_write_buffer_size() > self.max_buffer:
+                self.stats['skipped'] += 1
+                continue
+            center = arena.players[player_id].player.rect.center
+            tables = arena.visible(
+                state, util.rect.FloatRect(center, self.view_size))
+            connection.send(connection.encoder.encode(self.ticks, tables))
+
+    def report(self, elapsed):
+        """Print the last [elapsed] s of tick times and bandwidth."""
+        stats = self.stats
+        ticks = max(stats['ticks'], 1)
+        players = len(self.connections)
+        sent = sum(connection.sent for connection in self.connections.values())
+        for connection in self.connections.values():
+            connection.sent = 0
+        tick_ms = (stats['simulation'] + stats['snapshots']) / ticks * 1000.0
+        print('{} players, {} enemies, {} projectiles | tick {:.2f} ms '
+              '(sim {:.2f}, net {:.2f}, max {:.2f}, {:.3f}/player) | '
+              '{:.2f} kB/s/player | {} late, {} skipped'.format(
+                  players, len(self.arena.enemy_controller.enemies),
+                  len(self.arena.enemy_controller.projectiles), tick_ms,
+                  stats['simulation'] / ticks * 1000.0,
+                  stats['snapshots'] / ticks * 1000.0,
+                  self.max_tick_time * 1000.0, tick_ms / max(players, 1),
+                  sent / 1024.0 / elapsed / max(players, 1),
+                  stats['late'], stats['skipped']), flush=True)
+        self.reset_stats()
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Multiplayer arena server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--world-size', type=util.cli.world_size,
+                        default=settings.WORLD_SIZE, metavar='WxH',
+                        help='arena size')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the enemies')
+    parser.add_argument('--enemies-per-player', type=float, default=2.0,
+                        help='most enemies per live player')
+    parser.add_argument('--snapshot-rate', type=float, default=20,
+                        help='snapshots sent per second')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='seconds to run, forever by default')
+    parser.add_argument('--report-interval', type=float, default=1.0,
+                        help='seconds between tick time reports')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    arena = ArenaSimulation(args.world_size, seed=args.seed,
+                            enemies_per_player=args.enemies_per_player)
+    game_server = GameServer(arena, args.snapshot_rate,
+                             report_interval=args.report_interval)
+    asyncio.run(game_server.serve(args.host, args.port, args.duration))
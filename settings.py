@@ -0,0 +1,28 @@
+"""Tunable game settings."""
+
+# Fixed simulation ticks per second
+SIMULATION_RATE = 60
+# Maximum frames drawn per second
+RENDER_RATE = 60
+# Most real time (ms) simulated per frame, so a stall can't snowball
+MAX_FRAME_TIME = 250
+# Redraw only the regions that changed instead of the whole screen
+DIRTY_RECTS = False
+# Size of the window in px
+SCREEN_SIZE = (800, 450)
+# Size of the arena in px, the camera follows the player when it is
+# bigger than the screen
+WORLD_SIZE = (800, 450)
+# Side of the square chunks the world is split into, in px
+CHUNK_SIZE = 400
+# Enemies more than this many chunks from the player's are far: they
+# hold their shot, only check whether to fire every FAR_INTERVAL ms and
+# only move every FAR_INTERVAL ms. Chunks are only a unit of distance,
+# projectiles and collisions run at full detail everywhere
+ACTIVE_CHUNKS = 2
+FAR_INTERVAL = 500
+# Fewest players sharing one collision pass for CollisionController's
+# spatial hash to be used. One grid rebuild costs about as much as eight
+# linear scans (`python benchmark.py broad_phase`), so below that every
+# player scans the arrays instead
+BROAD_PHASE_MIN_QUERIES = 8
@@ -0,0 +1,487 @@
+"""
+Binary snapshots of a running simulation, to save, resume or move it.
+
+    snapshot.save(simulation, 'game.snap')
+    simulation = snapshot.load('game.snap')
+
+A snapshot is a HEADER, a JSON index of its sections and then each
+section's array, packed and 64-byte aligned. Sections are NumPy
+structured arrays (see the dtypes below), so reading one is a view
+into the file mapped with mmap and restoring copies whole columns at
+once; only enemies are rebuilt one object at a time.
+
+Both SimulationController and server.ArenaSimulation are captured with
+everything that decides how the game plays on: the players, their
+teleporters and trails, the enemies with their archetypes, health,
+movement and pending timer events in order, the projectiles and the
+enemy RNG. Input sources and the archetype specs are not part of it;
+enemies refer to their archetype by name.
+
+"""
+
+import gc
+import itertools
+import json
+import mmap
+import os
+import struct
+import numpy
+import archetypes
+import controller
+import model
+
+MAGIC = b'TPSN'
+# Bumped whenever a section's layout or meaning changes
+VERSION = 3
+HEADER = struct.Struct('<4sHxxQ')  # magic, version, index length
+ALIGN = 64
+
+# Kinds of simulation
+SINGLE = 0  # SimulationController
+ARENA = 1  # server.ArenaSimulation
+
+STATE = numpy.dtype([
+    ('kind', '<i8'), ('tick', '<i8'), ('time', '<f8'), ('kills', '<i8'),
+    ('game_over', '<i8'), ('dt', '<f8'), ('size', '<f8', (2,)),
+    ('next_player_id', '<i8'), ('enemies_per_player', '<f8'),
+    ('now', '<f8'), ('spawned_at', '<f8'),
+    ('spawn_cooldown', '<f8'), ('spawn_cooldown_step', '<f8'),
+    ('min_spawn_cooldown', '<f8'), ('max_spawn_cooldown', '<f8'),
+    ('enemy_cooldown', '<f8'), ('projectile_speed', '<f8'),
+    ('spawn_due', '<f8'), ('spawn_sequence', '<i8'),
+    ('next_projectile_id', '<i8'), ('random_index', '<i8'),
+    ('random_gauss', '<f8'),
+])
+PLAYER = numpy.dtype([
+    ('id', '<i8'), ('dead', '<i8'), ('kills', '<i8'),
+    ('center', '<f8', (2,)), ('size', '<f8', (2,)),
+    ('teleporter_center', '<f8', (2,)), ('teleporter_size', '<f8', (2,)),
+    ('now', '<f8'), ('trail_capacity', '<i8'), ('decay_time', '<f8'),
+])
+TRAIL = numpy.dtype([
+    ('player', '<i8'), ('center', '<f8', (2,)), ('size', '<f8', (2,)),
+    ('created_at', '<f8'),
+])
+ENEMY = numpy.dtype([
+    ('id', '<i8'), ('center', '<f8', (2,)), ('size', '<f8', (2,)),
+    ('cooldown', '<f8'), ('fired_at', '<f8'), ('fire_due', '<f8'),
+    ('fire_sequence', '<i8'), ('archetype', '<i8'), ('health', '<f8'),
+    ('burst', '<i8'), ('spawned_at', '<f8'), ('anchor', '<f8', (2,)),
+    ('heading', '<f8', (2,)),
+])
+PROJECTILE = numpy.dtype([
+    ('id', '<i8'), ('owner', '<i8'), ('position', '<f8', (2,)),
+    ('previous', '<f8', (2,)), ('velocity', '<f8', (2,)),
+    ('size', '<f8', (2,)),
+])
+RANDOM = numpy.dtype('<u4')
+
+# Fields of STATE copied to and from the EnemyController as they are
+ENEMY_CONTROLLER_FIELDS = (
+    'spawn_cooldown', 'spawn_cooldown_step',
+    'min_spawn_cooldown', 'max_spawn_cooldown', 'enemy_cooldown',
+    'projectile_speed',
+)
+
+
+def number(value):
+    """Return the float [value] as an int if it is whole, as saved."""
+    value = float(value)
+    # Sizes and cooldowns start out as ints, keep them equal in repr
+    return int(value) if value.is_integer() else value
+
+
+def numbers(values):
+    """
+    Return the float array [values] as nested lists, see number().
+
+    The whole array is ints or floats, so one check covers every value.
+
+    """
+    values = numpy.asarray(values)
+    if numpy.array_equal(values, numpy.trunc(values)):
+        return values.astype(numpy.int64).tolist()
+    return values.tolist()
+
+
+def times(values):
+    """
+    Return the clock times [values] as a list, 0 as an int.
+
+    A TimerQueue starts at int 0 and turns float once it advances, so a
+    whole time other than 0 is still a float.
+
+    """
+    return [0 if value == 0 else value for value in values.tolist()]
+
+
+def clock_time(value):
+    """Return the clock time [value], 0 as an int, see times()."""
+    value = float(value)
+    return value if value else 0
+
+
+def sizes(values):
+    """Return the (width, height) [values] as saved, see number()."""
+    return tuple(number(value) for value in values)
+
+
+def player_controllers(simulation):
+    """Return [(player id, PlayerController, dead, kills)] of the game."""
+    if hasattr(simulation, 'players'):
+        return [(player_id, player_controller,
+                 player_id in simulation.dead, simulation.kills[player_id])
+                for player_id, player_controller
+                in simulation.players.items()]
+    return [(0, simulation.player_controller, simulation.game_over,
+             simulation.kills)]
+
+
+def capture(simulation):
+    """Return dict of section name -> array of the [simulation]'s state."""
+    enemy_controller = simulation.enemy_controller
+    states = numpy.zeros(1, STATE)
+    state = states[0]  # Writes through to [states]
+    arena = hasattr(simulation, 'players')
+    state['kind'] = ARENA if arena else SINGLE
+    state['tick'] = simulation.tick
+    state['dt'] = simulation.dt
+    if arena:
+        state['size'] = simulation.size
+        state['next_player_id'] = next(simulation.ids)
+        state['enemies_per_player'] = simulation.enemies_per_player
+        simulation.ids = itertools.count(int(state['next_player_id']))
+    else:
+        state['size'] = simulation.game_view_size
+        state['time'] = simulation.time
+        state['kills'] = simulation.kills
+        state['game_over'] = simulation.game_over
+    for name in ENEMY_CONTROLLER_FIELDS:
+        state[name] = getattr(enemy_controller, name)
+    state['spawned_at'] = enemy_controller.spawned_at
+    state['now'] = enemy_controller.timers.now
+    _, words, gauss = enemy_controller.random.getstate()
+    state['random_index'] = words[-1]
+    state['random_gauss'] = numpy.nan if gauss is None else gauss
+
+    # Players and their trails
+    rows = player_controllers(simulation)
+    players = numpy.zeros(len(rows), PLAYER)
+    trails = []
+    for i, (player_id, player_controller, dead, kills) in enumerate(rows):
+        player = player_controller.player
+        trail = player_controller.trail
+        players[i] = (player_id, dead, kills, player.rect.center,
+                      player.rect.size, player.teleporter.rect.center,
+                      player.teleporter.rect.size,
+                      player_controller.timers.now, len(trail.created_at),
+                      trail.decay_time)
+        live = trail.rows()
+        entries = numpy.zeros(len(live), TRAIL)
+        entries['player'] = i
+        entries['center'] = trail.center[live]
+        entries['size'] = trail.size[live]
+        entries['created_at'] = trail.created_at[live]
+        trails.append(entries)
+
+    # Enemies, with their pending shots
+    enemies = enemy_controller.enemies
+    rows = numpy.zeros(len(enemies), ENEMY)
+    rows['id'] = [enemy.id for enemy in enemies]
+    centers, half_sizes = enemy_controller.geometry()
+    rows['center'] = centers
+    rows['size'] = half_sizes * 2.0
+    rows['cooldown'] = [enemy.cooldown for enemy in enemies]
+    rows['fired_at'] = [enemy.fired_at for enemy in enemies]
+    rows['fire_due'] = numpy.nan
+    # Archetypes by name, the EnemyController restored into has its own
+    names = {}
+    rows['archetype'] = [names.setdefault(enemy.archetype.name, len(names))
+                         for enemy in enemies]
+    rows['health'] = [enemy.health for enemy in enemies]
+    rows['burst'] = [enemy.burst for enemy in enemies]
+    rows['spawned_at'] = [enemy.spawned_at for enemy in enemies]
+    rows['anchor'] = numpy.array([enemy.anchor for enemy in enemies],
+                                 dtype=float).reshape(-1, 2)
+    rows['heading'] = numpy.array([enemy.heading for enemy in enemies],
+                                  dtype=float).reshape(-1, 2)
+    index = {enemy.id: i for i, enemy in enumerate(enemies)}
+    state['spawn_due'] = numpy.nan
+    spawn, fire = enemy_controller.spawn_due, enemy_controller.fire
+    shots = []
+    for due, sequence, callback, args in enemy_controller.timers.events:
+        if callback is None:
+            continue  # Cancelled
+        elif callback == fire:
+            shots.append((index[args[0].id], due, sequence))
+        elif callback == spawn:
+            state['spawn_due'] = due
+            state['spawn_sequence'] = sequence
+        else:
+            raise ValueError('no snapshot layout for event {!r}'.format(
+                callback))
+    if shots:
+        shooters, due, sequence = zip(*shots)
+        shooters = list(shooters)
+        rows['fire_due'][shooters] = due
+        rows['fire_sequence'][shooters] = sequence
+
+    projectiles = enemy_controller.projectiles
+    n = projectiles.count
+    shots = numpy.zeros(n, PROJECTILE)
+    for name in ('id', 'owner', 'position', 'previous', 'velocity', 'size'):
+        shots[name] = getattr(projectiles, name)[:n]
+    state['next_projectile_id'] = projectiles.next_id
+
+    return {
+        'state': states,
+        'random': numpy.array(words[:-1], dtype=RANDOM),
+        'players': players,
+        'trail': (numpy.concatenate(trails) if trails
+                  else numpy.zeros(0, TRAIL)),
+        'enemies': rows,
+        'archetypes': numpy.array([name.encode() for name in names],
+                                  dtype=bytes),
+        'projectiles': shots,
+    }
+
+
+def create(sections):
+    """Return a new simulation restored from the snapshot [sections]."""
+    state = sections['state'][0]
+    size = tuple(float(x) for x in state['size'])
+    if state['kind'] == ARENA:
+        import server
+        simulation = server.ArenaSimulation(
+            size, float(state['dt']),
+            enemies_per_player=float(state['enemies_per_player']))
+    else:
+        simulation = controller.SimulationController(size,
+                                                     dt=float(state['dt']))
+    restore(simulation, sections)
+    return simulation
+
+
+def restore(simulation, sections):
+    """Set the [simulation] to the state in the snapshot [sections]."""
+    # Building thousands of enemies would set off collections that walk
+    # the whole heap, again and again; nothing built here is garbage
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return restore_state(simulation, sections)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def restore_state(simulation, sections):
+    """Do restore() with the garbage collector paused."""
+    state = sections['state'][0]
+    if (state['kind'] == ARENA) != hasattr(simulation, 'players'):
+        raise ValueError('snapshot is of another kind of simulation')
+    enemy_controller = simulation.enemy_controller
+    simulation.tick = int(state['tick'])
+
+    # Players and their trails
+    players = sections['players']
+    trails = sections['trail']
+    size = tuple(float(x) for x in state['size'])
+    player_controllers = []
+    for i, row in enumerate(players):
+        if state['kind'] == ARENA:
+            player_controller = controller.PlayerController(size)
+        else:
+            player_controller = simulation.player_controller
+        player_controller.reset_player()
+        player_controller.timers.now = clock_time(row['now'])
+        player = player_controller.player
+        player.rect.center = tuple(row['center'].tolist())
+        player.rect.size = sizes(row['size'])
+        player.teleporter.rect.center = \
+            tuple(row['teleporter_center'].tolist())
+        player.teleporter.rect.size = sizes(row['teleporter_size'])
+        trail = model.TrailBuffer(player_controller.timers,
+                                  int(row['trail_capacity']),
+                                  float(row['decay_time']))
+        entries = trails[trails['player'] == i][-len(trail.created_at):]
+        trail.count = len(entries)
+        trail.center[:trail.count] = entries['center']
+        trail.size[:trail.count] = entries['size']
+        trail.created_at[:trail.count] = entries['created_at']
+        player_controller.trail = trail
+        player_controllers.append(player_controller)
+    if state['kind'] == ARENA:
+        simulation.players = {int(row['id']): player_controller
+                              for row, player_controller
+                              in zip(players, player_controllers)}
+        simulation.dead = set(players['id'][players['dead'] != 0].tolist())
+        simulation.kills = dict(zip(players['id'].tolist(),
+                                    players['kills'].tolist()))
+        simulation.ids = itertools.count(int(state['next_player_id']))
+        simulation.enemies_per_player = float(state['enemies_per_player'])
+    else:
+        simulation.time = float(state['time'])
+        simulation.kills = int(state['kills'])
+        simulation.game_over = bool(state['game_over'])
+
+    # Enemy controller
+    for name in ENEMY_CONTROLLER_FIELDS:
+        setattr(enemy_controller, name, number(state[name]))
+    enemy_controller.spawned_at = clock_time(state['spawned_at'])
+    words = tuple(sections['random'].tolist()) + (int(state['random_index']),)
+    gauss = float(state['random_gauss'])
+    enemy_controller.random.setstate(
+        (3, words, None if numpy.isnan(gauss) else gauss))
+    timers = enemy_controller.timers
+    timers.clear()
+    timers.now = clock_time(state['now'])
+
+    # Enemies, without collisions with the ids given out after this
+    rows = sections['enemies']
+    ids = rows['id'].tolist()
+    if ids:
+        model.Enemy.ids = itertools.count(max(next(model.Enemy.ids),
+                                              max(ids) + 1))
+    kinds = []
+    for name in sections['archetypes'].tolist():
+        name = name.decode()
+        if name in enemy_controller.archetypes:
+            kinds.append(enemy_controller.archetypes[name])
+        elif name == archetypes.DEFAULT.name:
+            kinds.append(archetypes.DEFAULT)
+        else:
+            raise ValueError('snapshot has unknown archetype {!r}'.format(
+                name))
+    enemies = []
+    projectiles = enemy_controller.projectiles
+    for (enemy_id, center, size, cooldown, fired_at, kind, health, burst,
+         spawned_at, anchor, heading) in zip(
+            ids, rows['center'].tolist(), numbers(rows['size']),
+            numbers(rows['cooldown']), times(rows['fired_at']),
+            rows['archetype'].tolist(), rows['health'].tolist(),
+            rows['burst'].tolist(), times(rows['spawned_at']),
+            rows['anchor'].tolist(), rows['heading'].tolist()):
+        enemy = model.Enemy(center, tuple(size), projectiles, timers,
+                            cooldown, kinds[kind])
+        enemy.id = enemy_id
+        enemy.fired_at = fired_at
+        enemy.health = health
+        enemy.burst = burst
+        enemy.spawned_at = spawned_at
+        enemy.anchor = tuple(anchor)
+        enemy.heading = tuple(heading)
+        enemies.append(enemy)
+    enemy_controller.enemies = enemies
+    enemy_controller.geometry_cache = None
+    enemy_controller.stale_rects = False
+
+    # Pending events, rescheduled in their original order
+    events = []
+    if not numpy.isnan(state['spawn_due']):
+        events.append((int(state['spawn_sequence']),
+                       float(state['spawn_due']), None))
+    shooters = numpy.flatnonzero(~numpy.isnan(rows['fire_due']))
+    events.extend(zip(rows['fire_sequence'][shooters].tolist(),
+                      rows['fire_due'][shooters].tolist(),
+                      shooters.tolist()))
+    events.sort()
+    spawn, fire = enemy_controller.spawn_due, enemy_controller.fire
+    scheduled = timers.extend((due, spawn, ()) if i is None
+                              else (due, fire, (enemies[i],))
+                              for _, due, i in events)
+    enemy_controller.fire_events = {event[3][0].id: event
+                                    for event in scheduled if event[3]}
+
+    # Projectiles, column by column
+    shots = sections['projectiles']
+    n = len(shots)
+    projectiles.clear()
+    if n > len(projectiles.owner):
+        projectiles.grow(n)
+    for name in ('id', 'owner', 'position', 'previous', 'velocity', 'size'):
+        getattr(projectiles, name)[:n] = shots[name]
+    projectiles.count = n
+    projectiles.next_id = int(state['next_projectile_id'])
+    return simulation
+
+
+def dumps(simulation):
+    """Return the snapshot of the [simulation] as bytes."""
+    sections = capture(simulation)
+    index = {}
+    offset = 0
+    for name, array in sections.items():
+        dtype = array.dtype.descr if array.dtype.names else array.dtype.str
+        index[name] = {'dtype': dtype, 'length': len(array),
+                       'offset': offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    text = json.dumps(index).encode()
+    # Pad the index so the data starts aligned
+    start = -(-(HEADER.size + len(text)) // ALIGN) * ALIGN
+    text += b' ' * (start - HEADER.size - len(text))
+    data = bytearray(start + offset)
+    HEADER.pack_into(data, 0, MAGIC, VERSION, len(text))
+    data[HEADER.size:start] = text
+    for name, array in sections.items():
+        begin = start + index[name]['offset']
+        data[begin:begin + array.nbytes] = array.tobytes()
+    return bytes(data)
+
+
+def parse(buffer):
+    """
+    Return dict of section name -> array viewing the snapshot [buffer].
+
+    Nothing is copied: the arrays read straight from the [buffer], e.g.
+    a mapped file.
+
+    """
+    magic, version, length = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a version {} snapshot'.format(VERSION))
+    index = json.loads(bytes(buffer[HEADER.size:HEADER.size + length]))
+    start = HEADER.size + length
+    sections = {}
+    for name, entry in index.items():
+        dtype = entry['dtype']
+        if not isinstance(dtype, str):
+            # Structured, with (name, type[, shape]) fields
+            dtype = [tuple(field[:2]) + tuple(tuple(shape)
+                                              for shape in field[2:])
+                     for field in dtype]
+        dtype = numpy.dtype(dtype)
+        sections[name] = numpy.frombuffer(buffer, dtype, entry['length'],
+                                          start + entry['offset'])
+    return sections
+
+
+def loads(data, simulation=None):
+    """Restore the snapshot bytes [data] into [simulation], or a new one."""
+    sections = parse(data)
+    if simulation is None:
+        return create(sections)
+    return restore(simulation, sections)
+
+
+def save(simulation, path):
+    """Write the snapshot of the [simulation] to [path], atomically."""
+    data = dumps(simulation)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def read(path):
+    """Return the sections of the snapshot at [path], mapped not read."""
+    with open(path, 'rb') as f:
+        return parse(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def load(path, simulation=None):
+    """Restore the snapshot at [path] into [simulation], or a new one."""
+    sections = read(path)
+    if simulation is None:
+        return create(sections)
+    return restore(simulation, sections)
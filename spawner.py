@@ -0,0 +1,141 @@
+"""Enemy spawn placement that samples the free space directly."""
+
+import numpy
+
+
+def free_boxes(bounds, hole):
+    """
+    Return [bounds] minus [hole] as up to 4 disjoint boxes.
+
+    Boxes are (left, top, right, bottom) tuples: a full-width band above
+    and below the hole, and the parts left and right of it in between.
+    Empty boxes are left out.
+
+        Parameters:
+            [bounds] box to split
+            [hole]   box to cut out of it, it may reach outside [bounds]
+
+    """
+    left, top, right, bottom = bounds
+    hole_left = max(left, hole[0])
+    hole_top = max(top, hole[1])
+    hole_right = min(right, hole[2])
+    hole_bottom = min(bottom, hole[3])
+    if hole_left >= hole_right or hole_top >= hole_bottom:
+        return [bounds]
+    boxes = [(left, top, right, hole_top),
+             (left, hole_bottom, right, bottom),
+             (left, hole_top, hole_left, hole_bottom),
+             (hole_right, hole_top, right, hole_bottom)]
+    return [box for box in boxes if box[0] < box[2] and box[1] < box[3]]
+
+
+class SpawnPlanner:
+    """
+    Picks spawn centers in the arena outside an exclusion zone.
+
+    Rather than retrying random points until one lands outside the zone,
+    the free space is split into at most 4 boxes, one is picked weighted
+    by its area and a point is drawn uniformly inside it, so each spawn
+    costs the same however little space is left. Avoiding existing
+    enemies is a bounded best-of-[tries]: the first candidate that
+    overlaps none is taken, otherwise the one overlapping fewest.
+
+        Attributes:
+            [random] random.Random the points are drawn from
+            [bounds] (left, top, right, bottom) box spawn centers lie in
+            [tries]  candidates drawn per spawn when avoiding enemies
+
+    """
+
+    def __init__(self, random, bounds, tries=8):
+        """
+        Create new SpawnPlanner.
+
+            Parameters:
+                [random] random.Random to draw from
+                [bounds] box spawn centers must lie in
+                [tries]  (optional) candidates per spawn when avoiding
+
+        """
+        self.random = random
+        self.bounds = bounds
+        self.tries = tries
+
+    def regions(self, exclusion, size):
+        """
+        Return (boxes, total area) of centers a [size] spawn may take.
+
+        A spawn overlaps the [exclusion] FloatRect when its center is
+        within the exclusion grown by half the spawn's size, so that grown
+        box is what gets cut out. With no exclusion the whole [bounds] are
+        free.
+
+        """
+        if exclusion is None:
+            return [self.bounds], ((self.bounds[2] - self.bounds[0])
+                                   * (self.bounds[3] - self.bounds[1]))
+        half_width = size[0] / 2.0
+        half_height = size[1] / 2.0
+        hole = (exclusion.left - half_width, exclusion.top - half_height,
+                exclusion.right + half_width, exclusion.bottom + half_height)
+        boxes = free_boxes(self.bounds, hole)
+        total = sum((box[2] - box[0]) * (box[3] - box[1]) for box in boxes)
+        return boxes, total
+
+    def sample(self, boxes, total, exclusion):
+        """Return a center drawn uniformly from the free [boxes]."""
+        if total <= 0:
+            # Nowhere is free, use the corner farthest from the exclusion
+            left, top, right, bottom = self.bounds
+            x = left if exclusion.centerx > (left + right) / 2.0 else right
+            y = top if exclusion.centery > (top + bottom) / 2.0 else bottom
+            return (x, y)
+        pick = self.random.random() * total
+        for box in boxes:
+            pick -= (box[2] - box[0]) * (box[3] - box[1])
+            if pick < 0:
+                break
+        return (self.random.uniform(box[0], box[2]),
+                self.random.uniform(box[1], box[3]))
+
+    def plan(self, count, exclusion, size, occupied=None):
+        """
+        Return [count] spawn centers clear of the [exclusion].
+
+            Parameters:
+                [count]     number of spawns in the wave
+                [exclusion] FloatRect no spawn may overlap, or None
+                [size]      tuple (width, height) of a spawn
+                [occupied]  (optional) (centers, half_sizes) arrays of
+                            rects to avoid, e.g. the existing enemies;
+                            spawns in the wave avoid each other too
+
+        """
+        boxes, total = self.regions(exclusion, size)
+        if occupied is None:
+            return [self.sample(boxes, total, exclusion)
+                    for _ in range(count)]
+        centers, half_sizes = occupied
+        # Overlap test on centers: every rect grows by half a spawn
+        reach = numpy.concatenate(
+            [half_sizes, numpy.empty((count, 2))]) + numpy.divide(size, 2.0)
+        centers = numpy.concatenate([centers, numpy.empty((count, 2))])
+        filled = len(half_sizes)
+        reach[filled:] = size
+        positions = []
+        for _ in range(count):
+            best = None
+            for _ in range(self.tries):
+                position = self.sample(boxes, total, exclusion)
+                overlaps = numpy.count_nonzero(
+                    (numpy.abs(centers[:filled] - position)
+                     < reach[:filled]).all(1))
+                if best is None or overlaps < best[0]:
+                    best = (overlaps, position)
+                if not overlaps:
+                    break
+            centers[filled] = best[1]
+            filled += 1
+            positions.append(best[1])
+        return positions
@@ -0,0 +1,43 @@
+"""CollisionController's shared grid against its per-player scans."""
+
+import random
+import controller
+import model
+import scheduler
+
+SIZE = (400, 300)
+
+
+def create_arena(seed=0):
+    """Return (players, enemies, projectiles) crowded into a small arena."""
+    rng = random.Random(seed)
+    clock = scheduler.TimerQueue()
+    projectiles = model.ProjectileStore()
+    players = []
+    for _ in range(12):
+        player = model.Player((rng.uniform(0, SIZE[0]),
+                               rng.uniform(0, SIZE[1])), (60, 60))
+        player.teleporter.grow(400)
+        players.append(player)
+    enemies = [model.Enemy((rng.uniform(0, SIZE[0]),
+                            rng.uniform(0, SIZE[1])), (20, 20),
+                           projectiles, clock)
+               for _ in range(500)]
+    for _ in range(2000):
+        projectiles.spawn((rng.uniform(0, SIZE[0]), rng.uniform(0, SIZE[1])),
+                          (10, 10), (0.0, 0.0))
+    return players, enemies, projectiles
+
+
+def test_shared_grid_matches_each_scan_in_order():
+    players, enemies, projectiles = create_arena()
+    scan = controller.CollisionController(SIZE)
+    grid = controller.CollisionController(SIZE, spatial_hash=True,
+                                          min_queries=1)
+    player_hits = grid.update_players(players, projectiles)
+    enemy_hits = grid.update_enemies(players, enemies)
+    assert any(len(rows) > 1 for rows in player_hits)
+    assert any(len(hit) > 1 for hit in enemy_hits)
+    for i, player in enumerate(players):
+        assert player_hits[i] == scan.update_player(player, projectiles)
+        assert enemy_hits[i] == scan.update_enemy(player, enemies)
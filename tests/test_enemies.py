@@ -0,0 +1,42 @@
+"""Level of detail of far enemies in EnemyController."""
+
+import controller
+import model
+
+
+def add_chaser(enemy_controller, center):
+    """Add a chasing enemy at [center] and return it."""
+    archetype = next(archetype
+                     for archetype in enemy_controller.archetypes.values()
+                     if archetype.behavior == 'chase')
+    enemy = model.Enemy(center, (20, 20), enemy_controller.projectiles,
+                        enemy_controller.timers, 1600, archetype)
+    enemy.anchor, enemy.heading = archetype.start(center,
+                                                  enemy_controller.random)
+    enemy_controller.add_enemy(enemy)
+    return enemy
+
+
+def test_far_enemies_move_once_per_far_interval():
+    enemy_controller = controller.EnemyController((4000, 3000), seed=0)
+    enemy_controller.target = model.Player((100, 100), (20, 20))
+    near = add_chaser(enemy_controller, (700, 700))
+    far = add_chaser(enemy_controller, (3800, 2800))
+    dt = 1000.0 / 60.0
+    ticks = 120
+    moves = {near: 0, far: 0}
+    centers = enemy_controller.geometry()[0]
+    rows = {near: 0, far: 1}
+    for _ in range(ticks):
+        before = {enemy: tuple(centers[row]) for enemy, row in rows.items()}
+        enemy_controller.timers.advance(dt)
+        enemy_controller.move_enemies(dt)
+        for enemy, row in rows.items():
+            moves[enemy] += tuple(centers[row]) != before[enemy]
+    assert moves[near] == ticks
+    far_steps = ticks * dt / enemy_controller.far_interval
+    assert 0 < moves[far] <= far_steps + 1
+    # It still closes in at its own speed, just in bigger steps
+    enemy_controller.sync_rects()
+    travelled = 3800 - far.rect.centerx
+    assert travelled > 0
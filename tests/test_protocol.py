@@ -0,0 +1,71 @@
+"""Round trips of protocol.py's wire format."""
+
+import asyncio
+import numpy
+import pytest
+import protocol
+
+
+def random_tables(rng, ids):
+    """Return snapshot tables of the [ids] with random states."""
+    tables = {}
+    for name, fields in protocol.KINDS:
+        kind_ids = numpy.sort(rng.choice(ids, rng.integers(0, len(ids)),
+                                         replace=False))
+        states = rng.integers(-32768, 32768, (len(kind_ids), fields))
+        tables[name] = (kind_ids, states.astype(protocol.STATE_TYPE))
+    return tables
+
+
+def test_quantize_rounds_to_half_pixels_and_clamps():
+    states = protocol.quantize([0.2, 0.3, -1.26, 16383.5, 20000.0, -20000.0])
+    assert states.dtype == protocol.STATE_TYPE
+    assert states.tolist() == [0, 1, -3, 32767, 32767, -32768]
+
+
+def test_decoder_follows_the_encoder():
+    rng = numpy.random.default_rng(0)
+    ids = numpy.arange(1, 100)
+    encoder = protocol.SnapshotEncoder()
+    decoder = protocol.SnapshotDecoder()
+    for tick in range(1, 30):
+        tables = random_tables(rng, ids)
+        assert decoder.apply(encoder.encode(tick, tables)) == tick
+        for name, (kind_ids, states) in tables.items():
+            decoded_ids, decoded_states = decoder.tables[name]
+            assert numpy.array_equal(decoded_ids, kind_ids), name
+            assert numpy.array_equal(decoded_states, states), name
+
+
+def test_unchanged_snapshot_is_small():
+    rng = numpy.random.default_rng(1)
+    tables = random_tables(rng, numpy.arange(1, 100))
+    encoder = protocol.SnapshotEncoder()
+    first = encoder.encode(1, tables)
+    second = encoder.encode(2, tables)
+    assert len(second) < len(first)
+    assert len(second) < 40
+
+
+def test_decoder_rejects_a_missed_baseline():
+    rng = numpy.random.default_rng(2)
+    encoder = protocol.SnapshotEncoder()
+    decoder = protocol.SnapshotDecoder()
+    decoder.apply(encoder.encode(1, random_tables(rng, numpy.arange(1, 9))))
+    encoder.encode(2, random_tables(rng, numpy.arange(1, 9)))
+    with pytest.raises(ValueError):
+        decoder.apply(encoder.encode(3, random_tables(rng,
+                                                      numpy.arange(1, 9))))
+
+
+def test_frames_read_back():
+    payloads = [b'', b'\x01', protocol.HELLO_BODY.pack(
+        protocol.HELLO, 7, 4000, 3000, 1000.0 / 60.0)]
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b''.join(protocol.frame(payload)
+                                  for payload in payloads))
+        reader.feed_eof()
+        return [await protocol.read_frame(reader) for _ in payloads]
+    assert asyncio.run(read_all()) == payloads
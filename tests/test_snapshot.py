@@ -0,0 +1,77 @@
+"""Round trips of snapshot.py's binary format."""
+
+import copy
+import numpy
+import pytest
+import controller
+import replay
+import server
+import snapshot
+
+
+def play(simulation, bots, ticks):
+    """Step an arena [simulation] [ticks] times with the [bots]' input."""
+    for _ in range(ticks):
+        inputs = {}
+        for player_id, bot in bots.items():
+            bot.poll()
+            inputs[player_id] = replay.encode_input(bot) | replay.RESTART
+        simulation.step(inputs)
+
+
+def test_single_player_plays_on_the_same():
+    simulation = controller.SimulationController(
+        (1600, 900), controller.RandomInputController(1), seed=2)
+    simulation.run(2000)
+    assert simulation.enemy_controller.enemies
+    resumed = snapshot.loads(snapshot.dumps(simulation))
+    assert replay.state_hash(resumed) == replay.state_hash(simulation)
+    resumed.input_source = copy.deepcopy(simulation.input_source)
+    for _ in range(1000):
+        simulation.step()
+        resumed.step()
+    assert replay.state_hash(resumed) == replay.state_hash(simulation)
+
+
+def test_arena_plays_on_the_same(tmp_path):
+    arena = server.ArenaSimulation((2000, 1500), seed=3,
+                                   enemies_per_player=3)
+    bots = {arena.add_player(): controller.RandomInputController(seed)
+            for seed in range(4)}
+    play(arena, bots, 1500)
+    assert arena.enemy_controller.enemies
+    path = str(tmp_path / 'arena.snap')
+    snapshot.save(arena, path)
+    resumed = snapshot.load(path)
+    assert resumed.enemies_per_player == 3
+    resumed_bots = copy.deepcopy(bots)
+    play(arena, bots, 1000)
+    play(resumed, resumed_bots, 1000)
+    assert resumed.kills == arena.kills
+    assert resumed.dead == arena.dead
+    # Enemy ids come from one counter shared by both, so only compare
+    # what is where
+    for name, (_, centers, states) in arena.world_state().items():
+        _, resumed_centers, resumed_states = resumed.world_state()[name]
+        assert numpy.array_equal(resumed_centers, centers), name
+        assert numpy.array_equal(resumed_states, states), name
+
+
+def test_sections_are_aligned():
+    simulation = controller.SimulationController((800, 450), seed=4)
+    simulation.run(600)
+    data = snapshot.dumps(simulation)
+    for name, array in snapshot.parse(data).items():
+        offset = array.__array_interface__['data'][0] \
+            - numpy.frombuffer(data, numpy.uint8).__array_interface__[
+                'data'][0]
+        assert offset % snapshot.ALIGN == 0, name
+
+
+def test_rejects_other_versions():
+    simulation = controller.SimulationController((800, 450), seed=5)
+    data = bytearray(snapshot.dumps(simulation))
+    snapshot.HEADER.pack_into(data, 0, snapshot.MAGIC,
+                              snapshot.VERSION + 1, 0)
+    with pytest.raises(ValueError):
+        snapshot.loads(bytes(data))
@@ -0,0 +1,25 @@
+"""Argument types shared by the command line entry points."""
+
+import argparse
+import settings
+
+# Largest side in px: server snapshots send positions as int16 half
+# pixels (see protocol.py), replay headers store sizes as uint16
+MAX_WORLD_SIDE = 16383
+
+
+def world_size(text):
+    """Parse a WIDTHxHEIGHT arena size, e.g. '4000x3000'."""
+    try:
+        width, height = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected WIDTHxHEIGHT, got {!r}'.format(text))
+    if width < settings.SCREEN_SIZE[0] or height < settings.SCREEN_SIZE[1]:
+        raise argparse.ArgumentTypeError(
+            'the world must be at least the screen size {}x{}'.format(
+                *settings.SCREEN_SIZE))
+    if width > MAX_WORLD_SIDE or height > MAX_WORLD_SIDE:
+        raise argparse.ArgumentTypeError(
+            'the world must be at most {0}x{0}'.format(MAX_WORLD_SIDE))
+    return (width, height)
@@ -0,0 +1,142 @@
+"""Uniform-grid spatial hash for broad-phase collision queries."""
+
+import numpy
+
+
+class SpatialHash:
+    """
+    Uniform grid bucketing points by the cell their center falls in.
+
+    Rebuilding is a counting sort of the cell keys, so every cell's items
+    sit in one contiguous run of [order] and a query only touches the rows
+    of cells it overlaps.
+
+        Attributes:
+            [cell_size] side length of a cell in px
+            [cols]      number of cell columns
+            [rows]      number of cell rows
+            [margin]    largest half extent of the hashed items in px
+            [order]     item indices sorted by cell
+            [starts]    offset of each cell's run in [order]
+
+    """
+
+    def __init__(self, size, cell_size=64):
+        """
+        Create new, empty SpatialHash.
+
+            Parameters:
+                [size]      tuple (width, height) of the hashed area
+                [cell_size] (optional) side length of a cell in px
+
+        """
+        width, height = size
+        self.cell_size = float(cell_size)
+        self.cols = max(1, int(numpy.ceil(width / self.cell_size)))
+        self.rows = max(1, int(numpy.ceil(height / self.cell_size)))
+        # Small keys let argsort use a linear-time radix sort
+        if self.cols * self.rows <= numpy.iinfo(numpy.uint16).max:
+            self.key_type = numpy.uint16
+        else:
+            self.key_type = numpy.intp
+        self.clear()
+
+    def clear(self):
+        """Empty the grid."""
+        self.margin = 0.0
+        self.order = numpy.zeros(0, dtype=numpy.intp)
+        self.starts = numpy.zeros(self.cols * self.rows + 1, dtype=numpy.intp)
+
+    def rebuild(self, centers, half_extents=0.0):
+        """
+        Rehash every item.
+
+            Parameters:
+                [centers]      float array (n, 2) of item centers
+                [half_extents] (optional) float array (n, 2) or scalar
+                               half (width, height) of the items
+
+        """
+        if len(centers) == 0:
+            self.clear()
+            return
+        scale = 1.0 / self.cell_size
+        cx = numpy.clip(centers[:, 0] * scale, 0, self.cols - 1)
+        cy = numpy.clip(centers[:, 1] * scale, 0, self.rows - 1)
+        keys = cy.astype(self.key_type)
+        keys *= self.cols
+        keys += cx.astype(self.key_type)
+        self.order = numpy.argsort(keys, kind='stable')
+        cells = self.cols * self.rows
+        self.starts = numpy.zeros(cells + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(keys, minlength=cells),
+                     out=self.starts[1:])
+        self.margin = float(numpy.max(half_extents))
+
+    def cell(self, v, n):
+        """Return the cell index of coordinate [v], clamped to [0, n)."""
+        return min(max(int(v // self.cell_size), 0), n - 1)
+
+    def query(self, rect):
+        """Return indices of items whose bounds may overlap the [rect]."""
+        if len(self.order) == 0:
+            return self.order
+        m = self.margin
+        cx0 = self.cell(rect.left - m, self.cols)
+        cx1 = self.cell(rect.right + m, self.cols)
+        cy0 = self.cell(rect.top - m, self.rows)
+        cy1 = self.cell(rect.bottom + m, self.rows)
+        runs = []
+        for cy in range(cy0, cy1 + 1):
+            row = cy * self.cols
+            runs.append(
+                self.order[self.starts[row + cx0]:self.starts[row + cx1 + 1]]
+            )
+        return numpy.concatenate(runs)
+
+    def pairs(self, centers, half_extents):
+        """
+        Return (items, rects) index arrays of the candidate pairs.
+
+        Like a query() per rect, but for every rect at once: each hashed
+        item that may overlap rect i comes back as a pair (item, i). The
+        cost is a few NumPy operations per row of cells a rect spans,
+        however many rects there are.
+
+            Parameters:
+                [centers]      float array (n, 2) of the rects' centers
+                [half_extents] float array (n, 2) or (n, 1) of their half
+                               (width, height)
+
+        """
+        empty = numpy.zeros(0, dtype=numpy.intp)
+        if len(self.order) == 0 or len(centers) == 0:
+            return empty, empty
+        reach = half_extents + self.margin
+        scale = 1.0 / self.cell_size
+        limit = numpy.array((self.cols - 1, self.rows - 1))
+        low = numpy.floor((centers - reach) * scale).astype(numpy.intp)
+        high = numpy.floor((centers + reach) * scale).astype(numpy.intp)
+        for cells in (low, high):
+            numpy.maximum(cells, 0, out=cells)
+            numpy.minimum(cells, limit, out=cells)
+        rects = numpy.arange(len(centers))
+        items, owners = [], []
+        for dy in range(int((high[:, 1] - low[:, 1]).max()) + 1):
+            cy = low[:, 1] + dy
+            inside = cy <= high[:, 1]
+            row = cy[inside] * self.cols
+            # A row's cells from cx0 to cx1 are one run of [order]
+            starts = self.starts[row + low[inside, 0]]
+            counts = self.starts[row + high[inside, 0] + 1] - starts
+            total = int(counts.sum())
+            if not total:
+                continue
+            ends = numpy.cumsum(counts)
+            positions = numpy.arange(total)
+            positions += numpy.repeat(starts - ends + counts, counts)
+            items.append(self.order[positions])
+            owners.append(numpy.repeat(rects[inside], counts))
+        if not items:
+            return empty, empty
+        return numpy.concatenate(items), numpy.concatenate(owners)
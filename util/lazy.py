@@ -0,0 +1,27 @@
+"""Deferred imports, so entry points only pay for what they use."""
+
+import importlib.util
+import sys
+
+
+def module(name):
+    """
+    Return the module [name], executed on its first attribute access.
+
+    Paths that never touch it (headless runs never touch pygame) skip
+    importing it at all. A module that is already imported is returned
+    as is.
+
+        Parameters:
+            [name] absolute module name, e.g. 'pygame'
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    lazy = importlib.util.module_from_spec(spec)
+    sys.modules[name] = lazy
+    loader.exec_module(lazy)
+    return lazy
@@ -1,31 +1,119 @@
-"""Utility functions for 2d vectors."""
+"""
+Utility functions for 2d vectors.
+
+The scalar functions take any (x, y) sequences and return a tuple, or
+write into [out] (a preallocated list or array row) and return it, so
+hot loops need not allocate. The *_many forms apply the same operation
+to NumPy arrays of shape (n, 2).
+
+"""
 
 import math
+import numpy
 
 
-def subtract(a, b):
+def subtract(a, b, out=None):
     """Subtract 2d vectors [a] - [b]."""
-    def subtract(a, b):
-        return a - b
-    return map(subtract, a, b)
+    x = a[0] - b[0]
+    y = a[1] - b[1]
+    if out is None:
+        return (x, y)
+    out[0] = x
+    out[1] = y
+    return out
+
+
+def multiply_scalar(a, v, out=None):
+    """Multiply 2d vector [v] by the scalar [a]."""
+    x = a * v[0]
+    y = a * v[1]
+    if out is None:
+        return (x, y)
+    out[0] = x
+    out[1] = y
+    return out
+
+
+def divide_scalar(a, v, out=None):
+    """Divide 2d vector [v] by the scalar [a]."""
+    a = float(a)
+    x = v[0] / a
+    y = v[1] / a
+    if out is None:
+        return (x, y)
+    out[0] = x
+    out[1] = y
+    return out
+
+
+def magnitude(v):
+    """Return the length of 2d vector [v]."""
+    return math.sqrt(v[0]*v[0] + v[1]*v[1])
+
+
+def normalize(v, out=None):
+    """Normalize 2d vector [v], the zero vector stays zero."""
+    x, y = v[0], v[1]
+    length = math.sqrt(x*x + y*y)
+    if length:
+        x /= length
+        y /= length
+    if out is None:
+        return (x, y)
+    out[0] = x
+    out[1] = y
+    return out
+
+
+def aim(origin, target, speed, out=None):
+    """Return the velocity of length [speed] from [origin] to [target]."""
+    x = target[0] - origin[0]
+    y = target[1] - origin[1]
+    length = math.sqrt(x*x + y*y)
+    if length:
+        x = x / length * speed
+        y = y / length * speed
+    if out is None:
+        return (x, y)
+    out[0] = x
+    out[1] = y
+    return out
+
+
+def subtract_many(a, b, out=None):
+    """Subtract arrays of 2d vectors [a] - [b]."""
+    return numpy.subtract(a, b, out=out)
+
+
+def multiply_scalar_many(a, v, out=None):
+    """Multiply an array of 2d vectors [v] by the scalar(s) [a]."""
+    return numpy.multiply(v, numpy.reshape(a, (-1, 1)) if numpy.ndim(a)
+                          else a, out=out)
+
+
+def divide_scalar_many(a, v, out=None):
+    """Divide an array of 2d vectors [v] by the scalar(s) [a]."""
+    return numpy.divide(v, numpy.reshape(a, (-1, 1)) if numpy.ndim(a)
+                        else a, out=out)
 
 
-def multiply_scalar(a, v):
-    """Multiply 2d vector by a scalar."""
-    def multiply(v):
-        return a * v
-    return map(multiply, v)
+def magnitude_many(v):
+    """Return the lengths of an array of 2d vectors [v]."""
+    return numpy.hypot(v[:, 0], v[:, 1])
 
 
-def divide_scalar(a, v):
-    """Divide 2d vector by a scalar."""
-    def divide(v):
-        return v / float(a)
-    return map(divide, v)
+def normalize_many(v, out=None):
+    """Normalize an array of 2d vectors [v], zero vectors stay zero."""
+    length = magnitude_many(v)
+    length[length == 0] = 1.0
+    return numpy.divide(v, length[:, None], out=out)
 
 
-def normalize(v):
-    """Normalize 2d vector [v]."""
-    x, y = v
-    magnitude = math.sqrt(x*x + y*y)
-    return divide_scalar(magnitude, v)
+def aim_many(origins, targets, speed, out=None):
+    """Return velocities of length [speed] from [origins] to [targets]."""
+    out = numpy.subtract(targets, origins, out=out)
+    length = magnitude_many(out)
+    length[length == 0] = 1.0
+    out /= length[:, None]
+    out *= speed
+    return out
@@ -1,6 +1,9 @@
 """Views for the game."""
 
+import collections
 import pygame
+import settings
+import util.rect
 
 
 class Color:
@@ -14,32 +17,269 @@ class Color:
     purple = (127, 0, 255)
 
 
+class SurfaceCache:
+    """
+    LRU cache of pre-rendered entity shapes.
+
+    Shapes are keyed by (shape, color, size, stroke, alpha), so entities
+    blit a ready surface instead of rasterizing primitives every frame.
+    Sizes are whole pixels, and the default [capacity] holds a full
+    TrailBuffer (128 entries) in each of its 8 alpha steps: a frame can
+    show more distinct shapes than the cache holds (enemy cooldown rings
+    alone take up to 61 sizes per archetype color), and then the LRU
+    evicts every shape just before it is drawn again.
+
+        Attributes:
+            [capacity] most surfaces kept before the least recently used
+                       one is evicted
+            [surfaces] OrderedDict of key -> Surface, oldest first
+            [hits]     number of get()s served from the cache
+            [misses]   number of get()s that had to render
+
+    """
+
+    # Background color keyed out of every cached surface
+    colorkey = (255, 0, 255)
+
+    def __init__(self, capacity=1024):
+        """
+        Create new, empty SurfaceCache.
+
+            Parameters:
+                [capacity] (optional) most surfaces kept
+
+        """
+        self.capacity = capacity
+        self.surfaces = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """Return the surface for [key], calling [render]() on a miss."""
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = render()
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.set_colorkey(self.colorkey, pygame.RLEACCEL)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def canvas(self, size):
+        """Return a blank surface of [size] filled with the [colorkey]."""
+        surface = pygame.Surface(size)
+        surface.fill(self.colorkey)
+        return surface
+
+    def circle(self, color, radius, stroke=0, alpha=255):
+        """
+        Return a circle surface, [radius]+1 px from its center to its edge.
+
+            Parameters:
+                [color]  tuple (r, g, b)
+                [radius] radius in px
+                [stroke] (optional) outline width, 0 to fill
+                [alpha]  (optional) opacity from 0 to 255
+
+        """
+        key = ('circle', color, radius, stroke, alpha)
+
+        def render():
+            surface = self.canvas((2*radius + 2, 2*radius + 2))
+            pygame.draw.circle(surface, color, (radius + 1, radius + 1),
+                               radius, stroke)
+            surface.set_alpha(alpha if alpha < 255 else None)
+            return surface
+        return self.get(key, render)
+
+    def rect(self, color, size, stroke=0):
+        """
+        Return a rect surface.
+
+            Parameters:
+                [color]  tuple (r, g, b)
+                [size]   tuple (width, height) in px
+                [stroke] (optional) outline width, 0 to fill
+
+        """
+        key = ('rect', color, size, stroke)
+
+        def render():
+            surface = self.canvas(size)
+            pygame.draw.rect(surface, color, ((0, 0), size), stroke)
+            return surface
+        return self.get(key, render)
+
+    def blit_circle(self, surface, color, center, radius, stroke=0,
+                    alpha=255, offset=(0, 0)):
+        """
+        Blit a cached circle centered on [center], return its Rect.
+
+        World coordinates are shifted by the int (x, y) [offset] of the
+        camera, here and in blit_rect().
+
+        """
+        x, y = center
+        return surface.blit(self.circle(color, radius, stroke, alpha),
+                            (int(x) - offset[0] - radius - 1,
+                             int(y) - offset[1] - radius - 1))
+
+    def blit_rect(self, surface, color, rect, stroke=0, offset=(0, 0)):
+        """Blit a cached rect over the [rect], return its Rect."""
+        size = (int(rect.width), int(rect.height))
+        return surface.blit(self.rect(color, size, stroke),
+                            (int(rect.left) - offset[0],
+                             int(rect.top) - offset[1]))
+
+
+# Shared cache of pre-rendered shapes
+surface_cache = SurfaceCache()
+
+
+class Camera:
+    """
+    Viewport onto the world that follows the player.
+
+    It stays inside the world, or centered on it when the world is
+    smaller than the screen.
+
+        Attributes:
+            [rect]   FloatRect of the visible part of the world
+            [offset] int (x, y) world position of the screen's top left
+
+    """
+
+    def __init__(self, size, world_size):
+        """
+        Create new Camera.
+
+            Parameters:
+                [size]       tuple (width, height) of the screen
+                [world_size] tuple (width, height) of the world
+
+        """
+        self.world_size = world_size
+        self.rect = util.rect.FloatRect((world_size[0]/2.0,
+                                         world_size[1]/2.0), size)
+        self.offset = (0, 0)
+        self.follow(self.rect.center)
+
+    def follow(self, center):
+        """Center the view on [center], as far as the world allows."""
+        self.rect.centerx = self.clamp(center[0], self.rect.width,
+                                       self.world_size[0])
+        self.rect.centery = self.clamp(center[1], self.rect.height,
+                                       self.world_size[1])
+        self.offset = (int(self.rect.left), int(self.rect.top))
+
+    @staticmethod
+    def clamp(x, view, world):
+        """Clamp the view's center [x] on one axis."""
+        if view >= world:
+            return world / 2.0
+        return min(max(x, view / 2.0), world - view / 2.0)
+
+
 class GameView:
-    """Game view."""
+    """
+    Game view.
+
+    In [dirty_rects] mode only the regions drawn over in the previous and
+    current frame are erased and pushed to the display, so frame time
+    scales with what is on screen instead of with the screen area. When
+    more than [max_dirty_rects] regions change the whole screen is
+    redrawn, since one flip is then cheaper.
+
+    """
+
+    def __init__(self, dirty_rects=False, max_dirty_rects=400,
+                 size=settings.SCREEN_SIZE, world_size=None):
+        """
+        Create game view.
 
-    def __init__(self):
-        """Create game view."""
+            Parameters:
+                [dirty_rects]     (optional) True to redraw changed regions
+                [max_dirty_rects] (optional) changed regions per frame above
+                                  which the whole screen is redrawn
+                [size]            (optional) tuple (width, height) screen
+                [world_size]      (optional) tuple (width, height) of the
+                                  world, the screen size by default
+
+        """
         # Instance variables
-        self.size = width, height = 800, 450
+        self.size = width, height = size
+        self.world_size = world_size or size
+        self.camera = Camera(self.size, self.world_size)
+        self.prev_offset = self.camera.offset
+        self.dirty_rects = dirty_rects
+        self.max_dirty_rects = max_dirty_rects
+        self.prev_rects = None  # None forces a full redraw
+        self.overlays = []  # drawn last, each returns the Rect drawn over
 
         # Create [screen]
         self.screen = pygame.display.set_mode(self.size)
+        # Blitting regions of a blank [background] erases them much faster
+        # than filling them
+        self.background = pygame.Surface(self.size).convert()
+        self.background.fill(Color.white)
+
+    def draw(self, player, enemies, projectiles, trail, alpha=1.0):
+        """
+        Draw the elements in view of the [camera] on the screen.
+
+        The camera should already follow the player. [enemies] are drawn
+        as given, so pass only those in view; projectiles and the
+        teleporter [trail] are culled here.
 
-    def draw(self, player, enemies, decaying_teleporters):
-        """Draw all elements on the screen."""
-        # Clear [screen]
-        self.screen.fill(Color.white)
+            Parameters:
+                [alpha] (optional) blend between the previous and current
+                        simulation state, for projectile interpolation
+
+        """
+        camera = self.camera
+        offset = camera.offset
+        # Clear [screen], or only what was drawn over last frame
+        full_redraw = (not self.dirty_rects or self.prev_rects is None
+                       or offset != self.prev_offset)
+        self.prev_offset = offset
+        if full_redraw:
+            self.screen.fill(Color.white)
+        else:
+            self.screen.blits([(self.background, rect, rect)
+                               for rect in self.prev_rects], False)
+        if self.world_size != self.size:
+            # Outline the edge of the world
+            pygame.draw.rect(self.screen, Color.purple,
+                             ((-offset[0], -offset[1]), self.world_size), 2)
 
         # Draw Objects
-        player.draw(self.screen)
+        rects = [player.draw(self.screen, offset)]
         for enemy in enemies:
-            enemy.draw(self.screen)
-            for projectile in enemy.projectiles:
-                projectile.draw(self.screen)
-        for decaying_teleporter in decaying_teleporters:
-            decaying_teleporter.draw(self.screen)
+            rects.append(enemy.draw(self.screen, offset))
+        rects.extend(projectiles.draw(self.screen, alpha, offset,
+                                      camera.rect))
+        rects.extend(trail.draw(self.screen, offset, camera.rect))
         # for projectile in projectiles:
         #     projectile.draw(screen)
+        for overlay in self.overlays:
+            rects.append(overlay.draw(self.screen))
 
         # Display
-        pygame.display.flip()
+        if full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.prev_rects + rects)
+        if len(rects) > self.max_dirty_rects:
+            self.prev_rects = None
+        else:
+            self.prev_rects = rects
+
+    def invalidate(self):
+        """Redraw the whole screen on the next frame."""
+        self.prev_rects = None